@@ -5,8 +5,10 @@
 import logging
 from flask import Flask, jsonify
 from .config import Config
-from .models import db
+from .models import db, ensure_favorites_index
 from .logging_config import setup_logging
+from .metrics import init_metrics
+from .tracing import init_tracing
 
 
 def create_app() -> Flask:
@@ -17,16 +19,28 @@ def create_app() -> Flask:
     # Инициализация БД
     db.init_app(app)
 
+    # Метрики HTTP-запросов и SQL, маршрут /metrics
+    with app.app_context():
+        init_metrics(app, db.engine)
+
+    # ID запроса и строка итогов со спанами
+    init_tracing(app)
+
     # Создание таблиц в контексте приложения
     with app.app_context():
         try:
             db.create_all()
+            ensure_favorites_index()
             app.logger.info("Database tables created/verified")
         except Exception as e:
             app.logger.warning(f"Tables already exist or error: {e}", exc_info=True)
 
     # Настройка логирования
-    setup_logging()
+    setup_logging(
+        queue_size=app.config['LOG_QUEUE_SIZE'],
+        rate_limit=app.config['LOG_RATE_LIMIT'],
+        rate_burst=app.config['LOG_RATE_BURST']
+    )
     logger = logging.getLogger(__name__)
     logger.info("Flask application created")
 
@@ -35,5 +49,12 @@ def create_app() -> Flask:
 
     app.register_blueprint(orders_bp, url_prefix='/api/main')
 
+    # Команды CLI
+    from .background import sweep_recent_command, invalidate_catalog_command, consume_order_events_command
+
+    app.cli.add_command(sweep_recent_command)
+    app.cli.add_command(invalidate_catalog_command)
+    app.cli.add_command(consume_order_events_command)
+
     logger.info("Blueprints registered successfully")
     return app
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""
+Фоновые задачи сервиса.
+"""
+
+import logging
+import threading
+import click
+from flask import Flask
+from flask.cli import with_appcontext
+from .cache import cleanup_expired_recent_products, get_redis_connection, sync_catalog_version, invalidate_catalog, CATALOG_CHANNEL
+from .order_events import create_stream_client, consumer_name, ensure_consumer_group, consume_order_events
+
+logger = logging.getLogger(__name__)
+
+
+def _sweep_recent_products_loop(app: Flask, interval: int, stop_event: threading.Event) -> None:
+    """Периодически удалять устаревшие популярные продукты."""
+    while not stop_event.wait(interval):
+        try:
+            with app.app_context():
+                removed = cleanup_expired_recent_products()
+            if removed:
+                logger.info(f"Recent products sweeper removed {removed} expired products")
+        except Exception as e:
+            logger.error(f"Recent products sweeper failed: {e}", exc_info=True)
+
+
+def _catalog_invalidation_loop(app: Flask, stop_event: threading.Event) -> None:
+    """Слушать смену версии каталога и сбрасывать L1-кэш воркера."""
+    while not stop_event.is_set():
+        pubsub = None
+        try:
+            with app.app_context():
+                pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CATALOG_CHANNEL)
+                # Версия читается после подписки, чтобы не пропустить смену между ними
+                sync_catalog_version()
+
+                while not stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and sync_catalog_version(message['data']):
+                        logger.info(f"Catalog L1 cache dropped, version {message['data']}")
+        except Exception as e:
+            logger.error(f"Catalog invalidation listener failed: {e}", exc_info=True)
+            stop_event.wait(5)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+
+def _order_events_loop(app: Flask, stop_event: threading.Event) -> None:
+    """Читать события заказов и обновлять счетчики популярности пачками."""
+    consumer = consumer_name()
+    while not stop_event.is_set():
+        client = None
+        try:
+            with app.app_context():
+                client = create_stream_client()
+                ensure_consumer_group(client)
+                block_ms = app.config['ORDER_EVENTS_BLOCK_MS']
+
+                while not stop_event.is_set():
+                    consume_order_events(client, consumer, block_ms)
+        except Exception as e:
+            logger.error(f"Order events consumer failed: {e}", exc_info=True)
+            stop_event.wait(5)
+        finally:
+            if client is not None:
+                client.close()
+
+
+def start_background_workers(app: Flask) -> threading.Event:
+    """Запустить фоновые потоки воркера. Возвращает событие для их остановки."""
+    stop_event = threading.Event()
+
+    interval = app.config['RECENT_SWEEP_INTERVAL']
+    if interval > 0:
+        threading.Thread(
+            target=_sweep_recent_products_loop,
+            args=(app, interval, stop_event),
+            name='recent-products-sweeper',
+            daemon=True
+        ).start()
+        logger.info(f"Recent products sweeper started with interval {interval}s")
+
+    threading.Thread(
+        target=_catalog_invalidation_loop,
+        args=(app, stop_event),
+        name='catalog-invalidation-listener',
+        daemon=True
+    ).start()
+
+    threading.Thread(
+        target=_order_events_loop,
+        args=(app, stop_event),
+        name='order-events-consumer',
+        daemon=True
+    ).start()
+
+    return stop_event
+
+
+@click.command('sweep-recent')
+@click.option('--batch-size', type=int, default=None, help='Размер пачки удаления.')
+@click.option('--max-batches', type=int, default=None, help='Максимум пачек за запуск.')
+@with_appcontext
+def sweep_recent_command(batch_size, max_batches):
+    """Удалить устаревшие популярные продукты (для запуска из cron)."""
+    removed = cleanup_expired_recent_products(batch_size=batch_size, max_batches=max_batches)
+    click.echo(f"Removed {removed} expired recent products")
+
+
+@click.command('invalidate-catalog')
+@with_appcontext
+def invalidate_catalog_command():
+    """Сбросить кэш каталога во всех воркерах после изменения меню."""
+    version = invalidate_catalog()
+    click.echo(f"Catalog cache invalidated, version {version}")
+
+
+@click.command('consume-order-events')
+@with_appcontext
+def consume_order_events_command():
+    """Применить накопившиеся события заказов без ожидания новых."""
+    client = create_stream_client()
+    try:
+        ensure_consumer_group(client)
+        total = 0
+        while True:
+            processed = consume_order_events(client, consumer_name())
+            if not processed:
+                break
+            total += processed
+    finally:
+        client.close()
+    click.echo(f"Applied {total} order events")
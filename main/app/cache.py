@@ -1,30 +1,420 @@
 import json
-import redis
+import threading
 import time
 from flask import current_app
+from redis.exceptions import LockError, WatchError
+from .local_cache import LocalCache, SingleFlight
+from .metrics import CATALOG_CACHE_LOOKUPS, CATALOG_CACHE_REBUILDS
+from .redis_pool import get_redis_client
+from .responses import PreparedBody
+
+CATALOG_VERSION_KEY = "cache:catalog:version"
+CATALOG_CHANNEL = "cache:catalog:invalidate"
+
+# Увеличивается при каждом изменении избранного; защищает заполнение кэша от гонки с записью
+FAVORITES_VERSION_KEY = "favorites:version"
+
+_catalog_cache = None
+_catalog_cache_lock = threading.Lock()
+
+_rebuild_flight = SingleFlight()
+_refreshing = set()
+_refreshing_lock = threading.Lock()
 
 
 def get_redis_connection():
-    return redis.from_url(current_app.config['CACHE_REDIS_URL'], decode_responses=True)
+    """Соединение с Redis из общего пула процесса."""
+    return get_redis_client()
+
+
+def get_catalog_cache() -> LocalCache:
+    """L1-кэш каталога текущего процесса."""
+    global _catalog_cache
+
+    if _catalog_cache is None:
+        with _catalog_cache_lock:
+            if _catalog_cache is None:
+                _catalog_cache = LocalCache(
+                    max_size=current_app.config['CATALOG_L1_MAX_SIZE'],
+                    ttl=current_app.config['CATALOG_L1_TTL']
+                )
+    return _catalog_cache
+
+
+def _prepare_body(body):
+    """Готовое тело ответа из сериализованного JSON."""
+    return PreparedBody.from_json(body, compress=current_app.config['CATALOG_GZIP'])
+
 
+def _products_body(products_data):
+    """
+    JSON ответа со списком продуктов.
+
+    Признака попадания в кэш в теле нет (он в заголовке X-Cache),
+    поэтому у одного и того же каталога всегда один ETag.
+    """
+    return json.dumps({
+        'products': products_data,
+        'count': len(products_data)
+    }, ensure_ascii=False, separators=(',', ':'))
+
+
+def _product_body(product_data):
+    """JSON ответа с отдельным продуктом."""
+    return json.dumps({
+        'product': product_data
+    }, ensure_ascii=False, separators=(',', ':'))
 
-def cache_products(products_data):
-    """Кэшировать список продуктов"""
+
+def _store_catalog_entry(key, body):
+    """
+    Сохранить готовое тело ответа в Redis и L1.
+
+    Ключ живет дольше PRODUCTS_CACHE_TTL на CATALOG_STALE_GRACE: в этот период
+    значение считается устаревшим, но еще отдается, пока идет пересборка.
+    """
     redis_conn = get_redis_connection()
-    key = "cache:products"
-    redis_conn.setex(key, current_app.config['PRODUCTS_CACHE_TTL'],
-                    json.dumps(products_data))
+    ttl_seconds = current_app.config['PRODUCTS_CACHE_TTL'] + current_app.config['CATALOG_STALE_GRACE']
+    redis_conn.setex(key, ttl_seconds, body)
+
+    prepared = _prepare_body(body)
+    get_catalog_cache().set(key, prepared)
+    return prepared
+
+
+def _get_catalog_entry(key):
+    """Готовое тело ответа из L1 или Redis и признак его устаревания."""
+    local_cache = get_catalog_cache()
+
+    cached = local_cache.get(key)
+    if cached is not None:
+        CATALOG_CACHE_LOOKUPS.labels('l1_hit').inc()
+        return cached, False
+
+    pipe = get_redis_connection().pipeline(transaction=False)
+    pipe.get(key)
+    pipe.ttl(key)
+    cached, ttl_seconds = pipe.execute()
+    if not cached:
+        CATALOG_CACHE_LOOKUPS.labels('miss').inc()
+        return None, False
+
+    CATALOG_CACHE_LOOKUPS.labels('redis_hit').inc()
+    prepared = _prepare_body(cached)
+    local_cache.set(key, prepared)
+    return prepared, ttl_seconds < current_app.config['CATALOG_STALE_GRACE']
+
+
+def get_cached_products_by_ids(product_ids):
+    """
+    Продукты из кэша по списку ID: сначала L1, остальные одним MGET.
+
+    Возвращает словарь {product_id: product_data} только для найденных.
+    """
+    local_cache = get_catalog_cache()
+    found = {}
+    remote_ids = []
+
+    for product_id in product_ids:
+        cached = local_cache.get(f"cache:product:{product_id}")
+        if cached is not None:
+            found[product_id] = json.loads(cached.body)['product']
+        else:
+            remote_ids.append(product_id)
+
+    if remote_ids:
+        values = get_redis_connection().mget([f"cache:product:{product_id}" for product_id in remote_ids])
+        for product_id, cached in zip(remote_ids, values):
+            if cached:
+                local_cache.set(f"cache:product:{product_id}", _prepare_body(cached))
+                found[product_id] = json.loads(cached)['product']
+
+    l1_hits = len(product_ids) - len(remote_ids)
+    redis_hits = len(found) - l1_hits
+    if l1_hits:
+        CATALOG_CACHE_LOOKUPS.labels('l1_hit').inc(l1_hits)
+    if redis_hits:
+        CATALOG_CACHE_LOOKUPS.labels('redis_hit').inc(redis_hits)
+    if len(remote_ids) > redis_hits:
+        CATALOG_CACHE_LOOKUPS.labels('miss').inc(len(remote_ids) - redis_hits)
+
+    return found
+
+
+def cache_products_by_ids(products_data):
+    """Кэшировать несколько продуктов одним pipeline."""
+    ttl_seconds = current_app.config['PRODUCTS_CACHE_TTL'] + current_app.config['CATALOG_STALE_GRACE']
+    local_cache = get_catalog_cache()
+
+    pipe = get_redis_connection().pipeline(transaction=False)
+    for product_data in products_data:
+        key = f"cache:product:{product_data['id']}"
+        body = _product_body(product_data)
+        pipe.setex(key, ttl_seconds, body)
+        local_cache.set(key, _prepare_body(body))
+    pipe.execute()
     return True
 
 
-def get_cached_products():
-    """Получить продукты из кэша"""
+def _wait_for_catalog_entry(key):
+    """
+    Дождаться, пока другой воркер, держащий блокировку, заполнит кэш.
+
+    Ожидание заканчивается и тогда, когда блокировка снята, а записи нет:
+    у победителя продукт не найден или загрузка упала, ждать нечего.
+    Возвращает (тело или None, истек ли CATALOG_REBUILD_WAIT).
+    """
+    redis_conn = get_redis_connection()
+    deadline = time.monotonic() + current_app.config['CATALOG_REBUILD_WAIT']
+
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.get(key)
+        pipe.exists(f"lock:{key}")
+        cached, locked = pipe.execute()
+        if not cached and not locked:
+            # Победитель мог записать тело и снять блокировку между GET и EXISTS
+            cached = redis_conn.get(key)
+        if cached:
+            prepared = _prepare_body(cached)
+            get_catalog_cache().set(key, prepared)
+            return prepared, False
+        if not locked:
+            return None, False
+    return None, True
+
+
+def _rebuild_catalog_entry(key, loader, body_builder):
+    """
+    Пересобрать запись каталога из БД ровно один раз.
+
+    Потоки воркера объединяются через SingleFlight, воркеры между собой -
+    через блокировку в Redis. Проигравшие ждут, пока победитель заполнит кэш,
+    и идут в БД сами, только если он снял блокировку без записи или истек таймаут.
+    """
+    def rebuild():
+        lock = get_redis_connection().lock(
+            f"lock:{key}",
+            timeout=current_app.config['CATALOG_REBUILD_LOCK_TTL']
+        )
+
+        if not lock.acquire(blocking=False):
+            prepared, timed_out = _wait_for_catalog_entry(key)
+            if prepared is not None:
+                CATALOG_CACHE_REBUILDS.labels('waited').inc()
+                return prepared
+            if timed_out:
+                CATALOG_CACHE_REBUILDS.labels('wait_timeout').inc()
+                current_app.logger.warning(f"Catalog rebuild lock wait timed out for {key}")
+            else:
+                CATALOG_CACHE_REBUILDS.labels('lock_released').inc()
+            data = loader()
+            return None if data is None else _prepare_body(body_builder(data))
+
+        try:
+            CATALOG_CACHE_REBUILDS.labels('rebuilt').inc()
+            data = loader()
+            if data is None:
+                return None
+            return _store_catalog_entry(key, body_builder(data))
+        finally:
+            try:
+                lock.release()
+            except LockError:
+                pass
+
+    return _rebuild_flight.do(key, rebuild)
+
+
+def _refresh_in_background(key, loader, body_builder):
+    """Обновить устаревшую запись в фоне, пока клиентам отдается старая."""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    app = current_app._get_current_object()
+
+    def refresh():
+        try:
+            with app.app_context():
+                lock = get_redis_connection().lock(
+                    f"lock:{key}",
+                    timeout=app.config['CATALOG_REBUILD_LOCK_TTL']
+                )
+                if not lock.acquire(blocking=False):
+                    return
+                try:
+                    CATALOG_CACHE_REBUILDS.labels('refreshed').inc()
+                    data = loader()
+                    if data is not None:
+                        _store_catalog_entry(key, body_builder(data))
+                finally:
+                    try:
+                        lock.release()
+                    except LockError:
+                        pass
+        except Exception as e:
+            app.logger.error(f"Background catalog refresh failed for {key}: {e}", exc_info=True)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    threading.Thread(target=refresh, name=f'refresh-{key}', daemon=True).start()
+
+
+def _load_catalog_entry(key, loader, body_builder):
+    """Готовое тело из кэша или после единственной пересборки; и признак попадания в кэш."""
+    prepared, stale = _get_catalog_entry(key)
+    if prepared is not None:
+        if stale:
+            _refresh_in_background(key, loader, body_builder)
+        return prepared, True
+
+    return _rebuild_catalog_entry(key, loader, body_builder), False
+
+
+def load_products(loader):
+    """
+    Ответ со списком продуктов.
+
+    loader() читает список продуктов из БД и вызывается только при промахе.
+    Возвращает (PreparedBody, cached).
+    """
+    return _load_catalog_entry("cache:products", loader, _products_body)
+
+
+def load_product(product_id, loader):
+    """
+    Ответ с отдельным продуктом.
+
+    loader() возвращает словарь продукта или None, если его нет.
+    Возвращает (PreparedBody или None, cached).
+    """
+    return _load_catalog_entry(f"cache:product:{product_id}", loader, _product_body)
+
+
+def get_catalog_version():
+    """Текущая версия каталога в Redis."""
+    return int(get_redis_connection().get(CATALOG_VERSION_KEY) or 0)
+
+
+def sync_catalog_version(version=None):
+    """
+    Привести L1-кэш к версии каталога.
+
+    Если версия изменилась, локальные копии каталога сбрасываются.
+    """
+    if version is None:
+        version = get_catalog_version()
+    return get_catalog_cache().set_version(int(version))
+
+
+def invalidate_catalog():
+    """
+    Сбросить кэш каталога во всех воркерах.
+
+    Удаляет копии каталога в Redis, увеличивает версию и рассылает ее
+    через pub/sub, чтобы воркеры очистили свои L1-кэши.
+    """
     redis_conn = get_redis_connection()
-    key = "cache:products"
-    cached = redis_conn.get(key)
-    if cached:
-        return json.loads(cached)
-    return None
+    product_keys = list(redis_conn.scan_iter(match="cache:product:*", count=500))
+
+    pipe = redis_conn.pipeline()
+    pipe.delete("cache:products", *product_keys)
+    pipe.incr(CATALOG_VERSION_KEY)
+    version = pipe.execute()[-1]
+
+    redis_conn.publish(CATALOG_CHANNEL, version)
+    sync_catalog_version(version)
+    return version
+
+
+def serialize_favorite(favorite):
+    """
+    JSON записи избранного: элемент sorted set (score = id) и часть ответа.
+
+    Один формат для кэша и для ответа при промахе, поэтому тело не зависит
+    от того, откуда взяты записи.
+    """
+    return json.dumps(favorite, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+
+def get_cached_favorites(after=0, limit=100):
+    """
+    Страница избранного из кэша (keyset по id > after).
+
+    Возвращает список JSON-строк записей (не более limit + 1, чтобы понять,
+    есть ли следующая страница) или None, если кэш не заполнен.
+    """
+    pipe = get_redis_connection().pipeline(transaction=False)
+    pipe.exists("favorites:ready")
+    pipe.zrangebyscore("favorites:items", f"({after}", "+inf", start=0, num=limit + 1)
+    ready, items = pipe.execute()
+    if not ready:
+        return None
+    return items
+
+
+def get_favorites_version():
+    """Версия избранного; читается до запроса в БД для заполнения кэша."""
+    return int(get_redis_connection().get(FAVORITES_VERSION_KEY) or 0)
+
+
+def cache_favorites(favorites, version):
+    """
+    Заполнить кэш избранного целиком.
+
+    version - версия, прочитанная до запроса в БД. Если за это время избранное
+    изменилось, данные могли устареть, и заполнение пропускается (False).
+    """
+    ttl_seconds = current_app.config['FAVORITES_CACHE_TTL']
+
+    with get_redis_connection().pipeline() as pipe:
+        try:
+            pipe.watch(FAVORITES_VERSION_KEY)
+            if int(pipe.get(FAVORITES_VERSION_KEY) or 0) != version:
+                return False
+
+            pipe.multi()
+            pipe.delete("favorites:items")
+            if favorites:
+                pipe.zadd("favorites:items", {serialize_favorite(favorite): favorite['id'] for favorite in favorites})
+                pipe.expire("favorites:items", ttl_seconds)
+            pipe.setex("favorites:ready", ttl_seconds, 1)
+            pipe.execute()
+        except WatchError:
+            return False
+    return True
+
+
+def cache_favorite_added(favorite):
+    """Добавить запись в кэш избранного (write-through)."""
+    pipe = get_redis_connection().pipeline()
+    pipe.incr(FAVORITES_VERSION_KEY)
+    pipe.zadd("favorites:items", {serialize_favorite(favorite): favorite['id']})
+    pipe.expire("favorites:items", current_app.config['FAVORITES_CACHE_TTL'])
+    pipe.execute()
+    return True
+
+
+def cache_favorite_removed(favorite_id):
+    """Удалить запись из кэша избранного (write-through)."""
+    pipe = get_redis_connection().pipeline()
+    pipe.incr(FAVORITES_VERSION_KEY)
+    pipe.zremrangebyscore("favorites:items", favorite_id, favorite_id)
+    pipe.execute()
+    return True
+
+
+def cache_favorites_drop():
+    """Сбросить кэш избранного; следующее чтение заполнит его из БД."""
+    pipe = get_redis_connection().pipeline()
+    pipe.incr(FAVORITES_VERSION_KEY)
+    pipe.delete("favorites:ready", "favorites:items")
+    pipe.execute()
+    return True
 
 
 def update_recent_products(products_data):
@@ -35,6 +425,10 @@ def update_recent_products(products_data):
     current_time = time.time()
     ttl_seconds = current_app.config['RECENT_PRODUCTS_CACHE_TTL']
 
+    # Бакет хранится, пока может попасть в самое длинное окно
+    bucket_key = f"recent_products:bucket:{int(current_time // 3600)}"
+    bucket_ttl = (max(current_app.config['RECENT_WINDOWS'].values()) + 2) * 3600
+
     pipe = redis_conn.pipeline()
 
     for product in products_data:
@@ -46,74 +440,196 @@ def update_recent_products(products_data):
         pipe.hset(product_key, "product_info", json.dumps(product['product_info']))
         pipe.hset(product_key, "last_updated", current_time)
         pipe.expire(product_key, ttl_seconds)
+        # Индекс по времени последнего заказа для фоновой очистки
+        pipe.zadd("recent_products:updated", {product_id: current_time})
+
+        # Часовой бакет для оконных рейтингов и общий справочник продуктов
+        pipe.zincrby(bucket_key, 1, product_id)
+        pipe.hset("recent_products:info", product_id, json.dumps(product['product_info']))
 
+    pipe.expire(bucket_key, bucket_ttl)
+    pipe.expire("recent_products:info", bucket_ttl)
     pipe.execute()
     return True
 
 
-def get_recent_products(limit=20):
+# Чтение лидерборда за один вызов: ранжирование, данные продуктов,
+# продление TTL и удаление устаревших записей выполняются атомарно на сервере.
+RECENT_PRODUCTS_SCRIPT = """
+local ids = redis.call('ZREVRANGE', KEYS[1], ARGV[1], ARGV[2], 'WITHSCORES')
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local result = {}
+
+for i = 1, #ids, 2 do
+    local product_id = ids[i]
+    local product_key = ARGV[5] .. product_id
+    local data = redis.call('HMGET', product_key, 'product_info', 'last_updated')
+
+    if not data[1] then
+        redis.call('ZREM', KEYS[1], product_id)
+        redis.call('ZREM', KEYS[2], product_id)
+    elseif now - tonumber(data[2] or 0) > ttl then
+        redis.call('ZREM', KEYS[1], product_id)
+        redis.call('ZREM', KEYS[2], product_id)
+        redis.call('DEL', product_key)
+    else
+        redis.call('EXPIRE', product_key, ttl)
+        table.insert(result, product_id)
+        table.insert(result, ids[i + 1])
+        table.insert(result, data[1])
+    end
+end
+
+return result
+"""
+
+
+# Оконный рейтинг: взвешенное объединение часовых бакетов кэшируется в KEYS[1]
+# до ротации, затем читается страница с данными продуктов из KEYS[2].
+WINDOWED_RECENT_PRODUCTS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    local buckets = #KEYS - 2
+    local args = {'ZUNIONSTORE', KEYS[1], buckets}
+    for i = 1, buckets do
+        table.insert(args, KEYS[i + 2])
+    end
+    table.insert(args, 'WEIGHTS')
+    for i = 1, buckets do
+        table.insert(args, ARGV[i + 3])
+    end
+    redis.call(unpack(args))
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+
+local ids = redis.call('ZREVRANGE', KEYS[1], ARGV[1], ARGV[2], 'WITHSCORES')
+local result = {}
+
+for i = 1, #ids, 2 do
+    local product_info = redis.call('HGET', KEYS[2], ids[i])
+    if product_info then
+        table.insert(result, ids[i])
+        table.insert(result, ids[i + 1])
+        table.insert(result, product_info)
+    end
+end
+
+return result
+"""
+
+
+def get_recent_products(limit=20, offset=0, window='all'):
     """
-    Получить популярные продукты, отсортированные по score
+    Получить популярные продукты, отсортированные по score.
+
+    window='all' - накопительный рейтинг, иначе - окно из RECENT_WINDOWS
+    с экспоненциальным затуханием старых бакетов.
     """
+    if window != 'all':
+        return _get_windowed_recent_products(limit, offset, window)
+
     redis_conn = get_redis_connection()
-    current_time = time.time()
     ttl_seconds = current_app.config['RECENT_PRODUCTS_CACHE_TTL']
 
-    # Получаем product_id и score из sorted set
-    product_scores = redis_conn.zrevrange("recent_products:score", 0, limit - 1, withscores=True)
+    script = redis_conn.register_script(RECENT_PRODUCTS_SCRIPT)
+    rows = script(
+        keys=["recent_products:score", "recent_products:updated"],
+        args=[offset, offset + limit - 1, time.time(), ttl_seconds, "recent_product:"]
+    )
 
     recent_products = []
+    for i in range(0, len(rows), 3):
+        product_id, score, product_info = rows[i:i + 3]
+        recent_products.append({
+            'product_id': int(product_id),
+            'score': int(float(score)),
+            'product_info': json.loads(product_info)
+        })
 
-    for product_id, score in product_scores:
-        product_key = f"recent_product:{product_id}"
+    return recent_products
 
-        # Проверяем, не истек ли TTL
-        product_data = redis_conn.hgetall(product_key)
-        if product_data:
-            last_updated = float(product_data.get('last_updated', 0))
-
-            # Если данные устарели, удаляем их
-            if current_time - last_updated > ttl_seconds:
-                redis_conn.zrem("recent_products:score", product_id)
-                redis_conn.delete(product_key)
-                continue
-
-            # Обновляем TTL при каждом обращении
-            redis_conn.expire(product_key, ttl_seconds)
-
-            product_info = json.loads(product_data['product_info'])
-            recent_products.append({
-                'product_id': int(product_id),
-                'score': int(score),
-                'product_info': product_info
-            })
-        else:
-            # Если данных о продукте нет, удаляем из sorted set
-            redis_conn.zrem("recent_products:score", product_id)
+
+def _get_windowed_recent_products(limit, offset, window):
+    """Рейтинг за последние N часов из часовых бакетов."""
+    redis_conn = get_redis_connection()
+    hours = current_app.config['RECENT_WINDOWS'][window]
+    half_life = current_app.config['RECENT_DECAY_HALF_LIFE_HOURS']
+
+    now = time.time()
+    current_bucket = int(now // 3600)
+    elapsed = (now % 3600) / 3600
+
+    # Бакеты от текущего к старым; самый старый входит в окно частично
+    bucket_keys = []
+    weights = []
+    for age in range(hours + 1):
+        weight = 0.5 ** (age / half_life)
+        if age == hours:
+            weight *= 1 - elapsed
+        bucket_keys.append(f"recent_products:bucket:{current_bucket - age}")
+        weights.append(weight)
+
+    # Объединение живет не дольше текущего часа
+    cache_ttl = max(1, min(current_app.config['RECENT_WINDOW_CACHE_TTL'], int(3600 - now % 3600)))
+    merged_key = f"recent_products:window:{window}:{current_bucket}"
+
+    script = redis_conn.register_script(WINDOWED_RECENT_PRODUCTS_SCRIPT)
+    rows = script(
+        keys=[merged_key, "recent_products:info", *bucket_keys],
+        args=[offset, offset + limit - 1, cache_ttl, *weights]
+    )
+
+    recent_products = []
+    for i in range(0, len(rows), 3):
+        product_id, score, product_info = rows[i:i + 3]
+        recent_products.append({
+            'product_id': int(product_id),
+            'score': round(float(score), 2),
+            'product_info': json.loads(product_info)
+        })
 
     return recent_products
 
 
-def cleanup_expired_recent_products():
+# Удаление одной пачки устаревших продуктов по индексу last_updated.
+# Выполняется атомарно, чтобы не удалить продукт, заказанный во время очистки.
+SWEEP_RECENT_PRODUCTS_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+
+for _, product_id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], product_id)
+    redis.call('ZREM', KEYS[2], product_id)
+    redis.call('DEL', ARGV[3] .. product_id)
+end
+
+return #ids
+"""
+
+
+def cleanup_expired_recent_products(batch_size=None, max_batches=None):
     """
-    Очистка устаревших записей о продуктах
+    Очистка устаревших записей о продуктах.
+
+    Устаревшие продукты выбираются диапазоном из индекса recent_products:updated
+    пачками по batch_size, не более max_batches пачек за вызов.
+    Возвращает количество удаленных продуктов.
     """
     redis_conn = get_redis_connection()
-    current_time = time.time()
     ttl_seconds = current_app.config['RECENT_PRODUCTS_CACHE_TTL']
+    batch_size = batch_size or current_app.config['RECENT_SWEEP_BATCH_SIZE']
+    max_batches = max_batches or current_app.config['RECENT_SWEEP_MAX_BATCHES']
 
-    # Получаем все product_id из sorted set
-    all_products = redis_conn.zrange("recent_products:score", 0, -1)
+    script = redis_conn.register_script(SWEEP_RECENT_PRODUCTS_SCRIPT)
+    expired_before = time.time() - ttl_seconds
 
-    pipe = redis_conn.pipeline()
+    removed = 0
+    for _ in range(max_batches):
+        count = script(
+            keys=["recent_products:score", "recent_products:updated"],
+            args=[expired_before, batch_size, "recent_product:"]
+        )
+        removed += count
+        if count < batch_size:
+            break
 
-    for product_id in all_products:
-        product_key = f"recent_product:{product_id}"
-        last_updated = redis_conn.hget(product_key, "last_updated")
-
-        if last_updated and (current_time - float(last_updated) > ttl_seconds):
-            pipe.zrem("recent_products:score", product_id)
-            pipe.delete(product_key)
-
-    pipe.execute()
-    return True
\ No newline at end of file
+    return removed
@@ -13,4 +13,59 @@ class Config:
 
     CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
     PRODUCTS_CACHE_TTL = int(os.environ.get('PRODUCTS_CACHE_TTL', 21600))  # 6 часов
-    RECENT_PRODUCTS_CACHE_TTL = int(os.environ.get('RECENT_PRODUCTS_CACHE_TTL', 3600))  # 1 ЧАС
\ No newline at end of file
+    RECENT_PRODUCTS_CACHE_TTL = int(os.environ.get('RECENT_PRODUCTS_CACHE_TTL', 3600))  # 1 ЧАС
+
+    # L1-кэш каталога в памяти воркера
+    CATALOG_L1_MAX_SIZE = int(os.environ.get('CATALOG_L1_MAX_SIZE', 256))
+    CATALOG_L1_TTL = int(os.environ.get('CATALOG_L1_TTL', 300))  # секунды
+    CATALOG_GZIP = os.environ.get('CATALOG_GZIP', 'true').lower() == 'true'  # хранить gzip-версию ответов
+
+    # Защита от одновременной пересборки кэша каталога
+    CATALOG_STALE_GRACE = int(os.environ.get('CATALOG_STALE_GRACE', 300))  # отдавать устаревшее, пока идет пересборка
+    CATALOG_REBUILD_LOCK_TTL = int(os.environ.get('CATALOG_REBUILD_LOCK_TTL', 10))  # секунды
+    CATALOG_REBUILD_WAIT = float(os.environ.get('CATALOG_REBUILD_WAIT', 2))  # ожидание чужой пересборки
+
+    # Кэш и страницы избранного
+    FAVORITES_CACHE_TTL = int(os.environ.get('FAVORITES_CACHE_TTL', 3600))  # секунды
+    FAVORITES_PAGE_LIMIT = int(os.environ.get('FAVORITES_PAGE_LIMIT', 100))
+    FAVORITES_MAX_LIMIT = int(os.environ.get('FAVORITES_MAX_LIMIT', 500))
+
+    # Максимум ID в пакетном запросе /get_products?ids=
+    BATCH_PRODUCTS_MAX_IDS = int(os.environ.get('BATCH_PRODUCTS_MAX_IDS', 100))
+    RECENT_PRODUCTS_MAX_LIMIT = int(os.environ.get('RECENT_PRODUCTS_MAX_LIMIT', 100))  # макс. размер страницы /get_recent
+
+    # Оконные рейтинги популярности: окно -> число часовых бакетов
+    RECENT_WINDOWS = {'hour': 1, 'day': 24}
+    RECENT_DEFAULT_WINDOW = os.environ.get('RECENT_DEFAULT_WINDOW', 'all')
+    RECENT_DECAY_HALF_LIFE_HOURS = float(os.environ.get('RECENT_DECAY_HALF_LIFE_HOURS', 6))
+    RECENT_WINDOW_CACHE_TTL = int(os.environ.get('RECENT_WINDOW_CACHE_TTL', 60))  # кэш объединения бакетов
+
+    # Фоновая очистка устаревших популярных продуктов (0 - выключена, запуск через CLI)
+    RECENT_SWEEP_INTERVAL = int(os.environ.get('RECENT_SWEEP_INTERVAL', 60))  # секунды
+    RECENT_SWEEP_BATCH_SIZE = int(os.environ.get('RECENT_SWEEP_BATCH_SIZE', 500))
+    RECENT_SWEEP_MAX_BATCHES = int(os.environ.get('RECENT_SWEEP_MAX_BATCHES', 20))
+
+    # Поток событий заказов от orders (по умолчанию - Redis сервиса заказов)
+    ORDER_EVENTS_REDIS_URL = os.environ.get('ORDER_EVENTS_REDIS_URL', os.environ.get('REDIS_URL', CACHE_REDIS_URL or ''))
+    ORDER_EVENTS_STREAM = os.environ.get('ORDER_EVENTS_STREAM', 'orders:events')
+    ORDER_EVENTS_GROUP = os.environ.get('ORDER_EVENTS_GROUP', 'recent-products')
+    ORDER_EVENTS_BATCH_SIZE = int(os.environ.get('ORDER_EVENTS_BATCH_SIZE', 100))
+    ORDER_EVENTS_BLOCK_MS = int(os.environ.get('ORDER_EVENTS_BLOCK_MS', 1000))  # ожидание новых событий
+    ORDER_EVENTS_CLAIM_IDLE_MS = int(os.environ.get('ORDER_EVENTS_CLAIM_IDLE_MS', 60000))  # забрать события упавшего воркера
+
+    # Пул соединений Redis (один на процесс gunicorn)
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 20))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 2))  # ожидание свободного соединения
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+
+    # ID запроса (ставит nginx или orders) и спаны обращений к БД и Redis
+    REQUEST_ID_HEADER = os.environ.get('REQUEST_ID_HEADER', 'X-Request-ID')
+    REQUEST_SPANS_LIMIT = int(os.environ.get('REQUEST_SPANS_LIMIT', 50))  # спанов в строке лога запроса
+    REQUEST_SUMMARY_LOG = os.environ.get('REQUEST_SUMMARY_LOG', 'true').lower() == 'true'
+
+    # Логирование через очередь и фоновый поток
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # при переполнении записи отбрасываются
+    LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 20))  # INFO-записей в секунду на место вызова, 0 - без ограничения
+    LOG_RATE_BURST = int(os.environ.get('LOG_RATE_BURST', 100))
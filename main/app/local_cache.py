@@ -0,0 +1,109 @@
+"""
+Кэш в памяти процесса (L1) перед Redis.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class LocalCache:
+    """Потокобезопасный LRU-кэш с TTL и версией данных."""
+
+    def __init__(self, max_size: int = 256, ttl: float = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Значение по ключу или None, если его нет или оно устарело."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value) -> None:
+        """Сохранить значение, вытесняя самые старые записи при переполнении."""
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        """Удалить все записи."""
+        with self._lock:
+            self._data.clear()
+
+    def set_version(self, version) -> bool:
+        """Запомнить версию данных; при ее смене кэш очищается."""
+        with self._lock:
+            if version == self.version:
+                return False
+            self.version = version
+            self._data.clear()
+            return True
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+class _Call:
+    """Выполняющийся в процессе вызов и его результат."""
+
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Объединение одновременных вызовов по ключу.
+
+    Пока первый поток выполняет функцию, остальные потоки с тем же ключом
+    ждут и получают его результат (или исключение).
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+
+        return call.result
@@ -1,11 +1,39 @@
 """
 Настройка логирования.
+
+Поток запроса не форматирует и не пишет записи: QueueHandler кладет их
+в ограниченную очередь, а QueueListener в фоновом потоке собирает JSON
+и пишет в stdout. При переполнении очереди запись отбрасывается, частые
+INFO-записи ограничиваются по месту вызова (кроме строк итогов запросов);
+отброшенные записи считаются в метрике log_records_dropped_total.
 """
 
+import copy
 import logging
+import queue
 import sys
 import json
+import threading
+import time
+import atexit
+from logging.handlers import QueueHandler, QueueListener
 from flask import has_request_context, request
+from .metrics import LOG_RECORDS_DROPPED
+from .tracing import REQUEST_SUMMARY_LOGGER, get_request_id
+
+
+def _request_fields():
+    """Поля текущего запроса для записи лога или None вне запроса."""
+    if not has_request_context():
+        return None
+    return {
+        "remote_addr": request.remote_addr,
+        "method": request.method,
+        "path": request.path,
+        "user_agent": request.headers.get("User-Agent"),
+        "request_id": get_request_id(),
+    }
+
 
 class JsonFormatter(logging.Formatter):
     def format(self, record):
@@ -21,22 +49,130 @@ class JsonFormatter(logging.Formatter):
             "container": "pizza_orders",
         }
 
-        if has_request_context():
-            log_entry.update({
-                "remote_addr": request.remote_addr,
-                "method": request.method,
-                "path": request.path,
-                "user_agent": request.headers.get("User-Agent"),
-            })
+        # Поля запроса собраны еще в потоке запроса (см. RequestQueueHandler)
+        request_fields = getattr(record, "request_fields", None) or _request_fields()
+        if request_fields:
+            log_entry.update(request_fields)
+
+        # Сколько записей того же места вызова отброшено перед этой
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            log_entry["suppressed"] = suppressed
+
+        # Дополнительные поля: logger.info(..., extra={'fields': {...}})
+        fields = getattr(record, "fields", None)
+        if fields:
+            log_entry.update(fields)
 
         if record.exc_info:
             log_entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            log_entry["exc_info"] = record.exc_text
 
         return json.dumps(log_entry, ensure_ascii=False)
 
-def setup_logging(container_name="pizza_orders"):
-    handler = logging.StreamHandler(sys.stdout)
+
+class RequestQueueHandler(QueueHandler):
+    """
+    Кладет записи в очередь без ожидания.
+
+    Текст сообщения, поля запроса и трассировка собираются сразу: в потоке
+    QueueListener контекста запроса уже нет. Если очередь полна, запись
+    отбрасывается и учитывается в метрике.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.request_fields = _request_fields()
+        if record.exc_info:
+            record.exc_text = self.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.labels('queue_full', record.name).inc()
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничение частоты INFO и DEBUG записей по месту вызова (логгер, файл, строка).
+
+    Token bucket: rate записей в секунду с всплеском до burst, rate=0 - без
+    ограничения. Предупреждения, ошибки и записи логгеров exempt проходят
+    всегда; число отброшенных записей добавляется к следующей пропущенной
+    записи того же места.
+    """
+
+    def __init__(self, rate: float, burst: int, exempt=()):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.exempt = frozenset(exempt)
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 0 or record.levelno > logging.INFO or record.name in self.exempt:
+            return True
+
+        key = (record.name, record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            allowed = tokens >= 1
+            if allowed:
+                self._buckets[key] = (tokens - 1, now, 0)
+            else:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+
+        if not allowed:
+            LOG_RECORDS_DROPPED.labels('rate_limited', record.name).inc()
+            return False
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class _LogQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # Очередь может быть полной: дождаться места, а не потерять остаток записей
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+
+
+def _stop_listener():
+    """Записать оставшиеся в очереди записи и остановить фоновый поток."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(_stop_listener)
+
+
+def setup_logging(container_name="pizza_orders", queue_size=10000, rate_limit=20, rate_burst=100):
+    global _listener
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    _stop_listener()
+    _listener = _LogQueueListener(queue.Queue(queue_size), stream_handler)
+    _listener.start()
+
+    handler = RequestQueueHandler(_listener.queue)
     handler.setFormatter(JsonFormatter())
+    # Строка итогов пишется одна на запрос: ее пропуск терял бы запросы целиком
+    handler.addFilter(RateLimitFilter(rate_limit, rate_burst, exempt=(REQUEST_SUMMARY_LOGGER,)))
 
     root_logger = logging.getLogger()
     root_logger.handlers.clear()
@@ -53,4 +189,4 @@ def setup_logging(container_name="pizza_orders"):
 
     logging.getLogger("werkzeug").setLevel(logging.WARNING)
 
-    print(f"JSON logging initialized for {container_name}", file=sys.stderr)
\ No newline at end of file
+    print(f"JSON logging initialized for {container_name}", file=sys.stderr)
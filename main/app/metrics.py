@@ -0,0 +1,122 @@
+"""
+Метрики Prometheus главного сервиса.
+
+Гистограммы задержек HTTP-запросов, команд Redis и SQL-запросов, счетчики
+кэша каталога. Каждый воркер gunicorn - отдельный процесс, поэтому при
+заданном PROMETHEUS_MULTIPROC_DIR значения пишутся в файлы общего каталога,
+а /metrics суммирует их по всем воркерам (каталог готовит gunicorn.conf.py).
+Без переменной используется обычный реестр процесса.
+"""
+
+import os
+import time
+from flask import Response, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from .tracing import record_span
+
+# От долей миллисекунды (Redis) до секунд (медленные запросы и пересборки)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Операции SQL, для остальных метка OTHER
+QUERY_OPERATIONS = {'SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH'}
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Время обработки HTTP-запроса',
+    ['method', 'route', 'status'], buckets=LATENCY_BUCKETS
+)
+REDIS_COMMAND_LATENCY = Histogram(
+    'redis_command_duration_seconds', 'Время выполнения команды Redis (pipeline - одно наблюдение)',
+    ['command'], buckets=LATENCY_BUCKETS
+)
+REDIS_COMMAND_ERRORS = Counter('redis_command_errors_total', 'Ошибки команд Redis', ['command'])
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'Время выполнения SQL-запроса',
+    ['operation'], buckets=LATENCY_BUCKETS
+)
+DB_QUERY_ERRORS = Counter('db_query_errors_total', 'Ошибки SQL-запросов', ['operation'])
+LOG_RECORDS_DROPPED = Counter(
+    'log_records_dropped_total', 'Отброшенные записи лога: queue_full, rate_limited', ['reason', 'logger']
+)
+CATALOG_CACHE_LOOKUPS = Counter(
+    'catalog_cache_lookups_total', 'Обращения к кэшу каталога: l1_hit, redis_hit, miss', ['result']
+)
+CATALOG_CACHE_REBUILDS = Counter(
+    'catalog_cache_rebuilds_total', 'Пересборки кэша каталога: rebuilt, waited, wait_timeout, lock_released, refreshed',
+    ['result']
+)
+
+
+def observe_redis_command(command: str, seconds: float, failed: bool) -> None:
+    """Учесть выполненную команду Redis в метриках и спанах запроса."""
+    REDIS_COMMAND_LATENCY.labels(command).observe(seconds)
+    record_span('redis', command, seconds)
+    if failed:
+        REDIS_COMMAND_ERRORS.labels(command).inc()
+
+
+def _query_operation(statement) -> str:
+    words = (statement or '').split(None, 1)
+    operation = words[0].upper() if words else ''
+    return operation if operation in QUERY_OPERATIONS else 'OTHER'
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_metrics_started', None)
+    if started is not None:
+        operation = _query_operation(statement)
+        seconds = time.perf_counter() - started
+        DB_QUERY_LATENCY.labels(operation).observe(seconds)
+        record_span('db', operation, seconds)
+
+
+def _handle_db_error(exception_context):
+    DB_QUERY_ERRORS.labels(_query_operation(exception_context.statement)).inc()
+
+
+def instrument_engine(engine) -> None:
+    """Подписаться на выполнение запросов движка SQLAlchemy."""
+    if event.contains(engine, 'before_cursor_execute', _before_cursor_execute):
+        return
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+    event.listen(engine, 'handle_error', _handle_db_error)
+
+
+def _start_request_timer():
+    g.metrics_started = time.perf_counter()
+
+
+def _observe_request(response):
+    started = g.get('metrics_started')
+    if started is not None:
+        # Шаблон маршрута, а не путь: ID в пути не размножают ряды
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_LATENCY.labels(request.method, route, str(response.status_code)).observe(
+            time.perf_counter() - started
+        )
+    return response
+
+
+def metrics():
+    """Метрики в текстовом формате Prometheus (по всем воркерам)."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_metrics(app, engine) -> None:
+    """Замер HTTP-запросов и SQL, маршрут /metrics вне префикса API (nginx его не проксирует)."""
+    app.before_request(_start_request_timer)
+    app.after_request(_observe_request)
+    instrument_engine(engine)
+    app.add_url_rule('/metrics', 'metrics', metrics, methods=['GET'])
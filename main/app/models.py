@@ -5,7 +5,7 @@
 from typing import Any, Dict
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Numeric
+from sqlalchemy import Numeric, text, delete
 
 db = SQLAlchemy()
 
@@ -40,13 +40,31 @@ class MenuPosition(db.Model):
         }
 
 
+ADD_FAVORITE_SQL = text("""
+    WITH product AS (
+        SELECT m.id, to_jsonb(m) AS info
+        FROM menu_positions m
+        WHERE m.id = :product_id
+    ), inserted AS (
+        INSERT INTO favorites_products (product_id, product_info)
+        SELECT id, info FROM product
+        ON CONFLICT (product_id) DO NOTHING
+        RETURNING id, product_id, product_info
+    )
+    SELECT EXISTS (SELECT 1 FROM product) AS product_exists,
+           i.id, i.product_id, i.product_info
+    FROM (SELECT 1) AS one
+    LEFT JOIN inserted i ON true
+""")
+
+
 class FavoritesProducts(db.Model):
     """Модель для хранения избранных продуктов."""
 
     __tablename__ = 'favorites_products'
 
     id = db.Column(db.Integer, primary_key=True)
-    product_id = db.Column(db.Integer, nullable=False)
+    product_id = db.Column(db.Integer, nullable=False, unique=True, index=True)
     product_info = db.Column(JSONB, nullable=False)
 
     def to_dict(self) -> dict[str, Any]:
@@ -55,4 +73,48 @@ class FavoritesProducts(db.Model):
             "id": self.id,
             "product_id": self.product_id,
             "product_info": self.product_info
-        }
\ No newline at end of file
+        }
+
+    @classmethod
+    def add(cls, product_id) -> tuple[bool, dict[str, Any] | None]:
+        """
+        Добавить продукт в избранное одним запросом.
+
+        Снимок продукта берется из menu_positions, повтор отсекается
+        уникальным индексом по product_id. Возвращает (продукт существует,
+        созданная запись в виде словаря или None, если она уже была).
+        """
+        row = db.session.execute(ADD_FAVORITE_SQL, {'product_id': product_id}).one()
+        if row.id is None:
+            return row.product_exists, None
+        return row.product_exists, {
+            "id": row.id,
+            "product_id": row.product_id,
+            "product_info": row.product_info
+        }
+
+    @classmethod
+    def remove(cls, product_id) -> int | None:
+        """Удалить продукт из избранного одним запросом. Возвращает id удаленной записи."""
+        return db.session.execute(
+            delete(cls).where(cls.product_id == product_id).returning(cls.id)
+        ).scalar()
+
+
+def ensure_favorites_index() -> None:
+    """
+    Уникальный индекс по favorites_products.product_id для уже созданных таблиц.
+
+    create_all не меняет существующие таблицы, поэтому дубликаты удаляются,
+    а индекс создается явно (для новых таблиц это no-op).
+    """
+    db.session.execute(text("""
+        DELETE FROM favorites_products a
+        USING favorites_products b
+        WHERE a.product_id = b.product_id AND a.id > b.id
+    """))
+    db.session.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_favorites_products_product_id "
+        "ON favorites_products (product_id)"
+    ))
+    db.session.commit()
@@ -0,0 +1,115 @@
+"""
+Чтение событий заказов из Redis Stream сервиса orders.
+
+События читаются группой потребителей пачками; пачка применяется
+к счетчикам популярности одним конвейером и только затем подтверждается.
+Неподтвержденные события упавшего воркера забираются через XAUTOCLAIM,
+поэтому доставка - не менее одного раза.
+"""
+
+import json
+import logging
+import os
+import socket
+import redis
+from flask import current_app
+from .cache import update_recent_products
+
+logger = logging.getLogger(__name__)
+
+
+def create_stream_client() -> redis.Redis:
+    """
+    Отдельный клиент для потока событий.
+
+    Блокирующий XREADGROUP держит соединение до ORDER_EVENTS_BLOCK_MS,
+    поэтому он не берет соединения из общего пула и у него свой таймаут сокета.
+    """
+    config = current_app.config
+    return redis.Redis.from_url(
+        config['ORDER_EVENTS_REDIS_URL'],
+        decode_responses=True,
+        socket_timeout=config['ORDER_EVENTS_BLOCK_MS'] / 1000 + config['REDIS_SOCKET_TIMEOUT'],
+        socket_connect_timeout=config['REDIS_SOCKET_CONNECT_TIMEOUT'],
+        socket_keepalive=True,
+    )
+
+
+def consumer_name() -> str:
+    """Имя потребителя в группе: хост и процесс воркера."""
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def ensure_consumer_group(client: redis.Redis) -> None:
+    """Создать группу потребителей, если ее еще нет (с начала потока)."""
+    try:
+        client.xgroup_create(
+            current_app.config['ORDER_EVENTS_STREAM'],
+            current_app.config['ORDER_EVENTS_GROUP'],
+            id='0',
+            mkstream=True
+        )
+    except redis.ResponseError as e:
+        if 'BUSYGROUP' not in str(e):
+            raise
+
+
+def _read_batch(client: redis.Redis, consumer: str, block_ms):
+    """Пачка событий: сначала зависшие у других потребителей, затем новые."""
+    config = current_app.config
+    stream = config['ORDER_EVENTS_STREAM']
+    group = config['ORDER_EVENTS_GROUP']
+    batch_size = config['ORDER_EVENTS_BATCH_SIZE']
+
+    claimed = client.xautoclaim(
+        stream, group, consumer, config['ORDER_EVENTS_CLAIM_IDLE_MS'], '0-0', count=batch_size
+    )
+    if claimed[1]:
+        return claimed[1]
+
+    response = client.xreadgroup(group, consumer, {stream: '>'}, count=batch_size, block=block_ms)
+    # RESP3 возвращает словарь {поток: сообщения}, RESP2 - список пар
+    if isinstance(response, dict):
+        response = list(response.items())
+    messages = []
+    for _, stream_messages in response or []:
+        messages.extend(stream_messages)
+    return messages
+
+
+def consume_order_events(client: redis.Redis, consumer: str, block_ms=None) -> int:
+    """
+    Прочитать и применить одну пачку событий.
+
+    Возвращает число обработанных событий.
+    """
+    config = current_app.config
+    messages = _read_batch(client, consumer, block_ms)
+    if not messages:
+        return 0
+
+    products = []
+    request_ids = []
+    for _, fields in messages:
+        # Удаленные из потока записи XAUTOCLAIM возвращает без полей
+        if fields and 'payload' in fields:
+            payload = json.loads(fields['payload'])
+            products.extend(payload.get('products', []))
+            if payload.get('request_id'):
+                request_ids.append(payload['request_id'])
+
+    if products:
+        update_recent_products(products)
+
+    message_ids = [message_id for message_id, _ in messages]
+    pipe = client.pipeline(transaction=False)
+    pipe.xack(config['ORDER_EVENTS_STREAM'], config['ORDER_EVENTS_GROUP'], *message_ids)
+    pipe.xdel(config['ORDER_EVENTS_STREAM'], *message_ids)
+    pipe.execute()
+
+    # ID запросов заказов связывают эту строку с логами orders
+    logger.info(
+        f"Applied {len(messages)} order events to recent products",
+        extra={'fields': {'request_ids': request_ids}}
+    )
+    return len(messages)
@@ -0,0 +1,63 @@
+"""
+Готовые тела ответов с ETag и предварительным сжатием.
+"""
+
+import gzip
+import hashlib
+import json
+from flask import Response, request
+
+# Меньшие тела не сжимаются: выигрыш меньше накладных расходов gzip
+GZIP_MIN_SIZE = 512
+
+
+class PreparedBody:
+    """Сериализованное тело ответа, его gzip-версия и ETag."""
+
+    __slots__ = ('body', 'gzipped', 'etag')
+
+    def __init__(self, body: bytes, compress: bool = True):
+        self.body = body
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.gzipped = None
+        if compress and len(body) >= GZIP_MIN_SIZE:
+            self.gzipped = gzip.compress(body, compresslevel=6)
+
+    @classmethod
+    def from_data(cls, data, compress: bool = True) -> 'PreparedBody':
+        """Сериализовать данные в JSON один раз."""
+        return cls.from_json(json.dumps(data, ensure_ascii=False, separators=(',', ':')), compress)
+
+    @classmethod
+    def from_json(cls, body: str, compress: bool = True) -> 'PreparedBody':
+        """Обернуть уже сериализованный JSON."""
+        return cls(body.encode('utf-8'), compress)
+
+
+def prepared_response(prepared: PreparedBody, status: int = 200, cached=None) -> Response:
+    """
+    Ответ из готового тела.
+
+    Учитывает If-None-Match (304 без тела) и Accept-Encoding (gzip-версия).
+    cached - признак попадания в кэш для заголовка X-Cache (HIT/MISS).
+    """
+    use_gzip = prepared.gzipped is not None and 'gzip' in request.accept_encodings
+    etag = f'{prepared.etag}-gz' if use_gzip else prepared.etag
+
+    if status == 200 and request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        response = Response(
+            prepared.gzipped if use_gzip else prepared.body,
+            status=status,
+            mimetype='application/json'
+        )
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    if cached is not None:
+        response.headers['X-Cache'] = 'HIT' if cached else 'MISS'
+    return response
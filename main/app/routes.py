@@ -1,8 +1,13 @@
 """Основные маршруты."""
 
 from flask import Blueprint, request, jsonify, current_app, Response
-from .cache import get_redis_connection, get_cached_products, cache_products, update_recent_products, get_recent_products, cleanup_expired_recent_products
+from .cache import (load_products, load_product, get_cached_products_by_ids, cache_products_by_ids,
+                    get_cached_favorites, cache_favorites, cache_favorite_added, cache_favorite_removed,
+                    cache_favorites_drop, get_favorites_version, serialize_favorite,
+                    update_recent_products, get_recent_products)
 from .models import MenuPosition, FavoritesProducts, db
+from .redis_pool import get_pool_stats
+from .responses import prepared_response
 import json
 
 bp = Blueprint('main', __name__)
@@ -11,34 +16,64 @@ bp = Blueprint('main', __name__)
 @bp.route('/get_products', methods=['GET'])
 def get_products():
     """Получение всех позиций из базы данных."""
+    if 'ids' in request.args:
+        return get_products_by_ids()
+
     try:
-        # Пробуем получить из кэша
-        cached_products = get_cached_products()
-        if cached_products:
+        # Кэш или единственная пересборка из БД на все одновременные запросы
+        prepared, cached = load_products(
+            lambda: [product.to_dict() for product in MenuPosition.query.all()]
+        )
+        if cached:
             current_app.logger.info("Returning products from cache")
-            return jsonify({
-                'products': cached_products,
-                'count': len(cached_products),
-                'cached': True
-            }), 200
 
-        # Если нет в кэше - идем в БД
-        products = MenuPosition.query.all()
+        return prepared_response(prepared, cached=cached)
 
-        # Преобразуем в список словарей
-        products_data = [product.to_dict() for product in products]
+    except Exception as e:
+        current_app.logger.error(f"Error in get_products: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
 
-        # Кэшируем результат
-        cache_products(products_data)
+
+def get_products_by_ids():
+    """Получение нескольких продуктов по списку ID (?ids=1,4,7)."""
+    try:
+        try:
+            product_ids = list(dict.fromkeys(
+                int(product_id) for product_id in request.args['ids'].split(',') if product_id.strip()
+            ))
+        except ValueError:
+            return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+
+        if not product_ids:
+            return jsonify({'error': 'ids must not be empty'}), 400
+
+        if len(product_ids) > current_app.config['BATCH_PRODUCTS_MAX_IDS']:
+            return jsonify({'error': f"No more than {current_app.config['BATCH_PRODUCTS_MAX_IDS']} ids allowed"}), 400
+
+        # Попадания - одним MGET
+        found = get_cached_products_by_ids(product_ids)
+        cached_count = len(found)
+
+        # Промахи - одним запросом WHERE id IN (...) и одним pipeline в кэш
+        missing_ids = [product_id for product_id in product_ids if product_id not in found]
+        if missing_ids:
+            loaded = [product.to_dict() for product in
+                      MenuPosition.query.filter(MenuPosition.id.in_(missing_ids)).all()]
+            if loaded:
+                cache_products_by_ids(loaded)
+            found.update((product['id'], product) for product in loaded)
+
+        products_data = [found[product_id] for product_id in product_ids if product_id in found]
 
         return jsonify({
             'products': products_data,
             'count': len(products_data),
-            'cached': False
+            'not_found': [product_id for product_id in product_ids if product_id not in found],
+            'cached': cached_count
         }), 200
 
     except Exception as e:
-        current_app.logger.error(f"Error in get_products: {e}", exc_info=True)
+        current_app.logger.error(f"Error in get_products_by_ids: {e}", exc_info=True)
         return jsonify({'error': 'Internal server error'}), 500
 
 
@@ -46,38 +81,35 @@ def get_products():
 def get_product(product_id):
     """Получение продукта по ID."""
     try:
-        # Для отдельных продуктов тоже можно кэшировать
-        cache_key = f"cache:product:{product_id}"
-        redis_conn = get_redis_connection()
-        cached = redis_conn.get(cache_key)
+        def load():
+            product = MenuPosition.query.get(product_id)
+            return product.to_dict() if product else None
 
-        if cached:
-            return jsonify({
-                'product': json.loads(cached),
-                'cached': True
-            }), 200
-
-        product = MenuPosition.query.get(product_id)
+        # Для отдельных продуктов тоже можно кэшировать
+        prepared, cached = load_product(product_id, load)
 
-        if not product:
+        if prepared is None:
             return jsonify({'error': 'Product not found'}), 404
 
-        product_data = product.to_dict()
-
-        # Кэшируем отдельный продукт
-        redis_conn.setex(cache_key, current_app.config['PRODUCTS_CACHE_TTL'],
-                         json.dumps(product_data))
-
-        return jsonify({
-            'product': product_data,
-            'cached': False
-        }), 200
+        return prepared_response(prepared, cached=cached)
 
     except Exception as e:
         current_app.logger.error(f"Error in get_product: {e}", exc_info=True)
         return jsonify({'error': 'Internal server error'}), 500
 
 
+def _sync_favorites_cache(update, value):
+    """Обновить кэш избранного после записи в БД; при ошибке кэш сбрасывается."""
+    try:
+        update(value)
+    except Exception as e:
+        current_app.logger.warning(f"Favorites cache update failed, dropping cache: {e}", exc_info=True)
+        try:
+            cache_favorites_drop()
+        except Exception:
+            pass
+
+
 @bp.route('/favorite', methods=['POST'])
 def make_favorite():
     """Добавить в избранное."""
@@ -88,25 +120,20 @@ def make_favorite():
 
         product_id = data['product_id']
 
-        # Проверяем существование продукта
-        product = MenuPosition.query.get(product_id)
-        if not product:
-            return jsonify({'error': 'Product does not exist'}), 404
-
-        # Проверяем, не добавлен ли уже продукт в избранное
-        exists = db.session.query(db.exists().where(FavoritesProducts.product_id == product_id)).scalar()
-        if not exists:
-            fav_product = FavoritesProducts(product_id=product_id, product_info=product.to_dict())
-
-            db.session.add(fav_product)
+        # Проверка продукта, снимок и вставка без дубликатов - одним запросом
+        try:
+            product_exists, favorite = FavoritesProducts.add(product_id)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            current_app.logger.error(f"Favorite product creation failed: {e}", exc_info=True)
+            return jsonify({'error': 'Internal server error'}), 500
 
-            try:
-                db.session.commit()
-            except Exception as e:
-                db.session.rollback()
-                current_app.logger.error(f"Favorite product creation failed: {e}", exc_info=True)
-                return jsonify({'error': 'Internal server error'}), 500
+        if not product_exists:
+            return jsonify({'error': 'Product does not exist'}), 404
 
+        if favorite:
+            _sync_favorites_cache(cache_favorite_added, favorite)
             return jsonify({'success': 'Favorite product created'}), 201
 
         return jsonify({'success': 'Favorite product already created'}), 208
@@ -126,16 +153,13 @@ def delete_favorite():
 
         product_id = data.get('product_id')
 
-        exists = db.session.query(db.exists().where(FavoritesProducts.product_id == product_id)).scalar()
+        deleted_id = FavoritesProducts.remove(product_id)
+        db.session.commit()
 
-        if not exists:
+        if deleted_id is None:
             return jsonify({'error': 'Product does not exist in favorites'}), 404
 
-        fav_product = FavoritesProducts.query.filter_by(product_id=product_id).first()
-        if fav_product:
-            db.session.delete(fav_product)
-
-        db.session.commit()
+        _sync_favorites_cache(cache_favorite_removed, deleted_id)
 
         return jsonify({'success': 'Favorite product deleted'}), 200
 
@@ -146,14 +170,33 @@ def delete_favorite():
 
 @bp.route('/get_favorites', methods=['GET'])
 def get_favorites():
-    """Получить избранное."""
+    """Получить избранное (keyset-пагинация: ?after=<id>&limit=)."""
     try:
-        products = FavoritesProducts.query.all()
+        after = request.args.get('after', 0, type=int)
+        limit = request.args.get('limit', current_app.config['FAVORITES_PAGE_LIMIT'], type=int)
 
-        # Преобразуем каждый объект в словарь
-        products_list = [product.to_dict() for product in products]
+        if after < 0 or limit < 1 or limit > current_app.config['FAVORITES_MAX_LIMIT']:
+            return jsonify({'error': 'Invalid after or limit'}), 400
 
-        return jsonify(products_list), 200
+        items = get_cached_favorites(after, limit)
+        if items is None:
+            # Кэш пуст - заполняем его целиком (размер ограничен уникальным product_id).
+            # Версия читается до БД: если избранное изменится, устаревший снимок не попадет в кэш
+            version = get_favorites_version()
+            favorites = [product.to_dict() for product in
+                         FavoritesProducts.query.order_by(FavoritesProducts.id).all()]
+            cache_favorites(favorites, version)
+            items = [serialize_favorite(favorite) for favorite in favorites if favorite['id'] > after]
+            items = items[:limit + 1]
+
+        # Записи уже сериализованы, собираем массив без повторного разбора
+        page = items[:limit]
+        response = Response('[' + ','.join(page) + ']', mimetype='application/json')
+
+        if len(items) > limit:
+            response.headers['X-Next-After'] = str(json.loads(page[-1])['id'])
+
+        return response
 
     except Exception as e:
         current_app.logger.error(f'Unexpected error in get_favorites: {e}', exc_info=True)
@@ -189,15 +232,25 @@ def make_recent():
 def get_recent():
     """Получить популярные продукты, отсортированные по score."""
     try:
-        # Очищаем устаревшие записи перед получением
-        cleanup_expired_recent_products()
-        
+        limit = request.args.get('limit', 20, type=int)
+        offset = request.args.get('offset', 0, type=int)
+        window = request.args.get('window', current_app.config['RECENT_DEFAULT_WINDOW'])
+
+        if limit < 1 or limit > current_app.config['RECENT_PRODUCTS_MAX_LIMIT'] or offset < 0:
+            return jsonify({'error': 'Invalid limit or offset'}), 400
+
+        if window != 'all' and window not in current_app.config['RECENT_WINDOWS']:
+            return jsonify({'error': f'Unknown window "{window}"'}), 400
+
         # Получаем популярные продукты
-        recent_products = get_recent_products()
+        recent_products = get_recent_products(limit=limit, offset=offset, window=window)
         
         return jsonify({
             'products': recent_products,
-            'count': len(recent_products)
+            'count': len(recent_products),
+            'limit': limit,
+            'offset': offset,
+            'window': window
         }), 200
 
     except Exception as e:
@@ -205,6 +258,12 @@ def get_recent():
         return jsonify({'error': 'Internal server error'}), 500
 
 
+@bp.route('/redis_pool', methods=['GET'])
+def redis_pool_stats():
+    """Статистика пула соединений Redis текущего воркера."""
+    return jsonify(get_pool_stats()), 200
+
+
 @bp.route('/health')
 def health_check():
     """Health check с минимальной задержкой."""
@@ -0,0 +1,108 @@
+"""
+ID запроса и спаны его обращений к БД и Redis.
+
+ID берется из заголовка REQUEST_ID_HEADER (его ставит nginx или передает
+orders в своих запросах) или создается, отдается в ответе и пишется в логи.
+Время каждого обращения копится спаном запроса; по окончании запроса
+итоги пишутся одной строкой лога.
+"""
+
+import logging
+import re
+import time
+import uuid
+from flask import current_app, g, has_request_context, request
+
+# Допустимый ID запроса; остальные значения заменяются новым ID
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._:-]{1,128}$')
+
+# Служебные маршруты без строки итогов
+SUMMARY_SKIP_ENDPOINTS = {'metrics', 'main.health_check'}
+
+# Логгер строк итогов: по одной на запрос, ограничение частоты его не режет
+REQUEST_SUMMARY_LOGGER = 'request_summary'
+summary_logger = logging.getLogger(REQUEST_SUMMARY_LOGGER)
+
+
+class RequestSpans:
+    """Спаны одного запроса: итоги по видам и первые limit спанов."""
+
+    __slots__ = ('started', 'limit', 'totals', 'items', 'dropped')
+
+    def __init__(self, limit: int):
+        self.started = time.perf_counter()
+        self.limit = limit
+        self.totals = {}
+        self.items = []
+        self.dropped = 0
+
+    def add(self, kind: str, name: str, seconds: float) -> None:
+        total = self.totals.setdefault(kind, [0, 0.0])
+        total[0] += 1
+        total[1] += seconds
+
+        if len(self.items) >= self.limit:
+            self.dropped += 1
+            return
+        start = time.perf_counter() - self.started - seconds
+        self.items.append({
+            'kind': kind,
+            'name': name,
+            'start_ms': round(start * 1000, 3),
+            'ms': round(seconds * 1000, 3),
+        })
+
+    def summary(self) -> dict:
+        return {
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 3),
+            'span_totals': {
+                kind: {'count': count, 'ms': round(seconds * 1000, 3)}
+                for kind, (count, seconds) in self.totals.items()
+            },
+            'spans': self.items,
+            'spans_dropped': self.dropped,
+        }
+
+
+def get_request_id():
+    """ID текущего запроса или None вне запроса."""
+    if not has_request_context():
+        return None
+    if 'request_id' not in g:
+        request_id = request.headers.get(current_app.config['REQUEST_ID_HEADER'])
+        if not request_id or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        g.request_id = request_id
+    return g.request_id
+
+
+def record_span(kind: str, name: str, seconds: float) -> None:
+    """Добавить спан к текущему запросу; вне запроса ничего не делает."""
+    if has_request_context():
+        spans = g.get('request_spans')
+        if spans is not None:
+            spans.add(kind, name, seconds)
+
+
+def _start_request():
+    get_request_id()
+    g.request_spans = RequestSpans(current_app.config['REQUEST_SPANS_LIMIT'])
+
+
+def _finish_request(response):
+    response.headers[current_app.config['REQUEST_ID_HEADER']] = get_request_id()
+
+    spans = g.pop('request_spans', None)
+    if (spans is not None and current_app.config['REQUEST_SUMMARY_LOG']
+            and request.endpoint not in SUMMARY_SKIP_ENDPOINTS):
+        summary_logger.info(
+            f"{request.method} {request.path} {response.status_code}",
+            extra={'fields': dict(spans.summary(), status=response.status_code)}
+        )
+    return response
+
+
+def init_tracing(app) -> None:
+    """ID запроса в ответе и строка итогов со спанами по каждому запросу."""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
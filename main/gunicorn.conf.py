@@ -0,0 +1,30 @@
+"""
+Настройки gunicorn главного сервиса.
+
+Метрики Prometheus воркеров собираются в общем каталоге
+PROMETHEUS_MULTIPROC_DIR, который очищается при старте мастера.
+"""
+
+import os
+import shutil
+
+bind = "0.0.0.0:5000"
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+
+# Логи в stdout/stderr для JSON-логирования контейнера
+accesslog = "-"
+errorlog = "-"
+capture_output = True
+enable_stdio_inheritance = True
+loglevel = "info"
+
+# Задается до загрузки приложения в воркерах: prometheus_client читает его при импорте
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+
+def on_starting(server):
+    """Удалить метрики прошлого запуска."""
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
@@ -1,6 +1,8 @@
 from app import create_app
+from app.background import start_background_workers
 
 app = create_app()
+start_background_workers(app)
 
 if __name__ == "__main__":
     app.run(debug=False)
\ No newline at end of file
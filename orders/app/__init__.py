@@ -5,8 +5,11 @@
 import logging
 from flask import Flask, jsonify
 from .config import Config
-from .models import db
+from .models import db, ensure_order_indexes
+from .partitions import ensure_order_partitions
 from .logging_config import setup_logging
+from .metrics import init_metrics
+from .tracing import init_tracing
 
 
 def create_app() -> Flask:
@@ -17,16 +20,31 @@ def create_app() -> Flask:
     # Инициализация БД
     db.init_app(app)
 
+    # Метрики HTTP-запросов и SQL, маршрут /metrics
+    with app.app_context():
+        init_metrics(app, db.engine)
+
+    # ID запроса и строка итогов со спанами
+    init_tracing(app)
+
     # Создание таблиц в контексте приложения
     with app.app_context():
         try:
             db.create_all()
+            # Индексы строятся только на секционированной таблице: на старой
+            # они лишь удлинили бы перенос (partition-orders)
+            if ensure_order_partitions():
+                ensure_order_indexes()
             app.logger.info("Database tables created/verified")
         except Exception as e:
-            app.logger.warning(f"Tables already exist or error: {e}", exc_info=True)
+            app.logger.warning(f"Database schema setup failed: {e}", exc_info=True)
 
     # Настройка логирования
-    setup_logging()
+    setup_logging(
+        queue_size=app.config['LOG_QUEUE_SIZE'],
+        rate_limit=app.config['LOG_RATE_LIMIT'],
+        rate_burst=app.config['LOG_RATE_BURST']
+    )
     logger = logging.getLogger(__name__)
     logger.info("Flask application created")
 
@@ -35,5 +53,19 @@ def create_app() -> Flask:
 
     app.register_blueprint(orders_bp, url_prefix='/api/orders')
 
+    # Команды CLI
+    from .order_batcher import bench_orders_command
+    from .partitions import partition_orders_command, archive_orders_command
+    from .export import export_orders_command
+    from .rollups import rebuild_sales_rollups_command
+    from .bench import bench_cart_command
+
+    app.cli.add_command(bench_orders_command)
+    app.cli.add_command(partition_orders_command)
+    app.cli.add_command(archive_orders_command)
+    app.cli.add_command(export_orders_command)
+    app.cli.add_command(rebuild_sales_rollups_command)
+    app.cli.add_command(bench_cart_command)
+
     logger.info("Blueprints registered successfully")
     return app
\ No newline at end of file
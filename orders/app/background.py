@@ -0,0 +1,107 @@
+"""
+Фоновые задачи сервиса.
+"""
+
+import logging
+import threading
+import time
+from flask import Flask
+from .catalog import CATALOG_CHANNEL, get_product_replica, warm_product_replica
+from .outbox import outbox_wakeup, publish_order_events
+from .partitions import ensure_order_partitions
+from .utils import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+
+def _product_replica_loop(app: Flask, stop_event: threading.Event) -> None:
+    """
+    Прогреть копию каталога и перечитывать ее при смене версии в main.
+
+    Без смены версии копия перечитывается раз в PRODUCT_REPLICA_TTL / 2:
+    записи не истекают, и корзина не возвращается к запросам в main.
+    """
+    refresh_interval = app.config['PRODUCT_REPLICA_TTL'] / 2
+    while not stop_event.is_set():
+        pubsub = None
+        try:
+            with app.app_context():
+                pubsub = get_redis_connection().pubsub(ignore_subscribe_messages=True)
+                # Подписка до прогрева, чтобы не пропустить смену версии во время загрузки
+                pubsub.subscribe(CATALOG_CHANNEL)
+                count = warm_product_replica()
+                logger.info(f"Product replica warmed with {count} products")
+                refresh_at = time.monotonic() + refresh_interval
+
+                while not stop_event.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message:
+                        count = warm_product_replica(version=message['data'])
+                        logger.info(f"Product replica reloaded for catalog version {message['data']}, {count} products")
+                        refresh_at = time.monotonic() + refresh_interval
+                    elif time.monotonic() >= refresh_at:
+                        count = warm_product_replica(version=get_product_replica().version)
+                        logger.info(f"Product replica refreshed, {count} products")
+                        refresh_at = time.monotonic() + refresh_interval
+        except Exception as e:
+            logger.error(f"Product replica refresh failed: {e}", exc_info=True)
+            stop_event.wait(5)
+        finally:
+            if pubsub is not None:
+                pubsub.close()
+
+
+def _order_events_relay_loop(app: Flask, interval: float, stop_event: threading.Event) -> None:
+    """Переносить события заказов из outbox в Redis Stream."""
+    while not stop_event.is_set():
+        try:
+            with app.app_context():
+                batch_size = app.config['ORDER_EVENTS_RELAY_BATCH']
+                # Пока outbox отдает полные пачки, отправляем без пауз
+                while publish_order_events(batch_size) == batch_size:
+                    pass
+        except Exception as e:
+            logger.error(f"Order events relay failed: {e}", exc_info=True)
+
+        outbox_wakeup.wait(interval)
+        outbox_wakeup.clear()
+
+
+def _order_partitions_loop(app: Flask, interval: int, stop_event: threading.Event) -> None:
+    """Периодически создавать партиции заказов на следующие месяцы."""
+    while not stop_event.wait(interval):
+        try:
+            with app.app_context():
+                ensure_order_partitions()
+        except Exception as e:
+            logger.error(f"Order partitions maintenance failed: {e}", exc_info=True)
+
+
+def start_background_workers(app: Flask) -> threading.Event:
+    """Запустить фоновые потоки воркера. Возвращает событие для их остановки."""
+    stop_event = threading.Event()
+
+    threading.Thread(
+        target=_product_replica_loop,
+        args=(app, stop_event),
+        name='product-replica',
+        daemon=True
+    ).start()
+
+    interval = app.config['ORDER_EVENTS_RELAY_INTERVAL']
+    threading.Thread(
+        target=_order_events_relay_loop,
+        args=(app, interval, stop_event),
+        name='order-events-relay',
+        daemon=True
+    ).start()
+    logger.info(f"Order events relay started with interval {interval}s")
+
+    threading.Thread(
+        target=_order_partitions_loop,
+        args=(app, app.config['ORDERS_PARTITION_CHECK_INTERVAL'], stop_event),
+        name='order-partitions',
+        daemon=True
+    ).start()
+
+    return stop_event
@@ -0,0 +1,61 @@
+"""
+Нагрузочный замер HTTP API корзины.
+
+Запускается против работающего сервиса, чтобы сравнить режимы воркеров
+gunicorn (GUNICORN_WORKER_CLASS=sync и gevent) на одном сценарии.
+"""
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import click
+import requests
+
+
+def _percentile(values, percent):
+    index = min(len(values) - 1, int(len(values) * percent / 100))
+    return values[index]
+
+
+@click.command('bench-cart')
+@click.option('--url', default='http://localhost:5001/api/orders', help='Базовый URL API заказов.')
+@click.option('--product-id', type=int, default=1, help='Продукт, добавляемый в корзину.')
+@click.option('--requests', 'count', type=int, default=2000, help='Всего запросов.')
+@click.option('--concurrency', type=int, default=100, help='Одновременных клиентов.')
+def bench_cart_command(url, product_id, count, concurrency):
+    """Замерить пропускную способность POST/GET /cart при одновременных клиентах."""
+    sessions = {}
+
+    def call(index):
+        # У каждого клиента своя корзина и свое keep-alive соединение
+        client = index % concurrency
+        if client not in sessions:
+            session = requests.Session()
+            session.headers['X-Cart-Id'] = f"bench-{uuid.uuid4().hex}"
+            sessions[client] = session
+        session = sessions[client]
+
+        started = time.monotonic()
+        try:
+            if index % 2:
+                response = session.get(f"{url}/cart", timeout=30)
+            else:
+                response = session.post(f"{url}/cart", json={'product_id': product_id}, timeout=30)
+            ok = response.status_code == 200
+        except requests.RequestException:
+            ok = False
+        return time.monotonic() - started, ok
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(call, range(count)))
+    elapsed = time.monotonic() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    errors = sum(1 for _, ok in results if not ok)
+    click.echo(f"{count} requests, concurrency {concurrency}: {elapsed:.2f}s, {count / elapsed:.1f} req/s, {errors} errors")
+    click.echo(
+        f"latency p50 {_percentile(latencies, 50) * 1000:.1f} ms, "
+        f"p95 {_percentile(latencies, 95) * 1000:.1f} ms, "
+        f"p99 {_percentile(latencies, 99) * 1000:.1f} ms"
+    )
@@ -0,0 +1,126 @@
+"""
+Локальная копия каталога main для сервиса заказов.
+
+Позволяет добавлять товары в корзину без синхронного запроса в main:
+копия прогревается при старте воркера и перечитывается при смене версии каталога,
+а без смены - раз в половину TTL записей, чтобы они не истекали.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+from .main_client import get_main_client
+from .metrics import PRODUCT_REPLICA_LOOKUPS
+
+# Канал, в который main публикует новую версию каталога
+CATALOG_CHANNEL = "cache:catalog:invalidate"
+
+
+class ProductReplica:
+    """Потокобезопасная ограниченная по размеру копия продуктов с TTL."""
+
+    def __init__(self, max_size: int = 1000, ttl: float = 3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.version = None
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, product_id: int):
+        """Продукт по ID или None, если его нет или запись устарела."""
+        with self._lock:
+            entry = self._data.get(product_id)
+            if entry is None:
+                return None
+
+            product, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._data[product_id]
+                return None
+
+            self._data.move_to_end(product_id)
+            return product
+
+    def put(self, product: dict) -> None:
+        """Сохранить продукт, вытесняя самые старые записи при переполнении."""
+        with self._lock:
+            self._put(product, time.monotonic() + self.ttl)
+
+    def replace_all(self, products: list, version=None) -> None:
+        """Заменить содержимое полным снимком каталога."""
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._data.clear()
+            for product in products:
+                self._put(product, expires_at)
+            self.version = version
+
+    def _put(self, product: dict, expires_at: float) -> None:
+        self._data[product['id']] = (product, expires_at)
+        self._data.move_to_end(product['id'])
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+
+_replica = None
+_replica_lock = threading.Lock()
+
+
+def get_product_replica() -> ProductReplica:
+    """Копия каталога текущего процесса."""
+    global _replica
+
+    if _replica is None:
+        with _replica_lock:
+            if _replica is None:
+                _replica = ProductReplica(
+                    max_size=current_app.config['PRODUCT_REPLICA_MAX_SIZE'],
+                    ttl=current_app.config['PRODUCT_REPLICA_TTL']
+                )
+    return _replica
+
+
+def warm_product_replica(version=None) -> int:
+    """Загрузить полный каталог из main. Возвращает число продуктов."""
+    response = get_main_client().get('get_products', '/get_products')
+    response.raise_for_status()
+
+    products = response.json()['products']
+    get_product_replica().replace_all(products, version)
+    return len(products)
+
+
+def get_product_info(product_id):
+    """
+    Информация о продукте для корзины.
+
+    Сначала ищется в локальной копии, при промахе запрашивается у main.
+    Возвращает копию словаря продукта или None, если продукта нет;
+    если main недоступен - MainServiceError.
+    """
+    try:
+        product_id = int(product_id)
+    except (TypeError, ValueError):
+        return None
+
+    replica = get_product_replica()
+    product = replica.get(product_id)
+    PRODUCT_REPLICA_LOOKUPS.labels('miss' if product is None else 'hit').inc()
+
+    if product is None:
+        response = get_main_client().get('get_product', f'/get_product/{product_id}')
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+
+        product = response.json()['product']
+        replica.put(product)
+
+    # Корзина меняет product_info (цена, дополнения), копия не должна меняться
+    return copy.deepcopy(product)
@@ -13,9 +13,67 @@ class Config:
 
     # Ссылка на main микросервис
     MAIN_SERVICE_URI = os.environ.get('MAIN_SERVICE_URI')
+    MAIN_SERVICE_TIMEOUT = float(os.environ.get('MAIN_SERVICE_TIMEOUT', 3))  # чтение ответа, секунды
+    MAIN_SERVICE_CONNECT_TIMEOUT = float(os.environ.get('MAIN_SERVICE_CONNECT_TIMEOUT', 1))  # секунды
+    MAIN_SERVICE_RETRIES = int(os.environ.get('MAIN_SERVICE_RETRIES', 1))  # повторов после первой попытки
+    MAIN_SERVICE_RETRY_BACKOFF = float(os.environ.get('MAIN_SERVICE_RETRY_BACKOFF', 0.1))  # база паузы, секунды
+    MAIN_SERVICE_POOL_SIZE = int(os.environ.get('MAIN_SERVICE_POOL_SIZE', 10))  # keep-alive соединений на воркер
+    MAIN_SERVICE_BREAKER_THRESHOLD = int(os.environ.get('MAIN_SERVICE_BREAKER_THRESHOLD', 5))  # ошибок подряд
+    MAIN_SERVICE_BREAKER_RESET = float(os.environ.get('MAIN_SERVICE_BREAKER_RESET', 30))  # секунды до пробного запроса
+
+    # Локальная копия каталога main
+    PRODUCT_REPLICA_MAX_SIZE = int(os.environ.get('PRODUCT_REPLICA_MAX_SIZE', 1000))
+    PRODUCT_REPLICA_TTL = int(os.environ.get('PRODUCT_REPLICA_TTL', 3600))  # секунды
     
+    # Страницы истории заказов GET /orders
+    ORDERS_PAGE_LIMIT = int(os.environ.get('ORDERS_PAGE_LIMIT', 50))
+    ORDERS_MAX_LIMIT = int(os.environ.get('ORDERS_MAX_LIMIT', 500))
+
+    # Потоковая выгрузка заказов: строк на одно чтение серверного курсора
+    ORDERS_EXPORT_BATCH_SIZE = int(os.environ.get('ORDERS_EXPORT_BATCH_SIZE', 1000))
+
+    # Помесячные партиции user_orders и их архивация
+    ORDERS_PARTITIONS_AHEAD = int(os.environ.get('ORDERS_PARTITIONS_AHEAD', 2))  # месяцев вперед
+    ORDERS_PARTITION_CHECK_INTERVAL = int(os.environ.get('ORDERS_PARTITION_CHECK_INTERVAL', 3600))  # секунды
+    ORDERS_ARCHIVE_AFTER_MONTHS = int(os.environ.get('ORDERS_ARCHIVE_AFTER_MONTHS', 12))
+    ORDERS_ARCHIVE_DIR = os.environ.get('ORDERS_ARCHIVE_DIR', '/app/archive')
+
+    # Групповая запись заказов: пачки одновременных заказов одним INSERT
+    ORDER_GROUP_COMMIT = os.environ.get('ORDER_GROUP_COMMIT', 'false').lower() == 'true'
+    ORDER_GROUP_COMMIT_WINDOW_MS = float(os.environ.get('ORDER_GROUP_COMMIT_WINDOW_MS', 5))
+    ORDER_GROUP_COMMIT_MAX_BATCH = int(os.environ.get('ORDER_GROUP_COMMIT_MAX_BATCH', 50))
+    ORDER_GROUP_COMMIT_TIMEOUT = float(os.environ.get('ORDER_GROUP_COMMIT_TIMEOUT', 10))  # ожидание в очереди до взятия в пачку
+
+    # Доставка событий заказов в main: outbox -> Redis Stream.
+    # Поток хранится в Redis с AOF и noeviction: после XADD событие есть только там
+    ORDER_EVENTS_REDIS_URL = os.environ.get('ORDER_EVENTS_REDIS_URL', os.environ.get('REDIS_URL'))
+    ORDER_EVENTS_STREAM = os.environ.get('ORDER_EVENTS_STREAM', 'orders:events')
+    ORDER_EVENTS_RELAY_BATCH = int(os.environ.get('ORDER_EVENTS_RELAY_BATCH', 100))
+    ORDER_EVENTS_RELAY_INTERVAL = float(os.environ.get('ORDER_EVENTS_RELAY_INTERVAL', 1))  # секунды
+
     # Redis конфигурация
     REDIS_URL = os.environ.get('REDIS_URL')
 
     # TTL корзины в секундах (48 часов по умолчанию)
-    CART_TTL_SECONDS = int(os.environ.get('CART_TTL_SECONDS', 172800))
\ No newline at end of file
+    CART_TTL_SECONDS = int(os.environ.get('CART_TTL_SECONDS', 172800))
+
+    # Откуда берется ID корзины покупателя: заголовок, затем cookie
+    CART_ID_HEADER = os.environ.get('CART_ID_HEADER', 'X-Cart-Id')
+    CART_COOKIE_NAME = os.environ.get('CART_COOKIE_NAME', 'cart_id')
+
+    # Пул соединений Redis (один на процесс gunicorn)
+    REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 20))
+    REDIS_POOL_TIMEOUT = float(os.environ.get('REDIS_POOL_TIMEOUT', 2))  # ожидание свободного соединения
+    REDIS_HEALTH_CHECK_INTERVAL = int(os.environ.get('REDIS_HEALTH_CHECK_INTERVAL', 30))
+    REDIS_SOCKET_TIMEOUT = float(os.environ.get('REDIS_SOCKET_TIMEOUT', 2))
+    REDIS_SOCKET_CONNECT_TIMEOUT = float(os.environ.get('REDIS_SOCKET_CONNECT_TIMEOUT', 2))
+
+    # ID запроса (ставит nginx) и спаны обращений к БД, Redis и main
+    REQUEST_ID_HEADER = os.environ.get('REQUEST_ID_HEADER', 'X-Request-ID')
+    REQUEST_SPANS_LIMIT = int(os.environ.get('REQUEST_SPANS_LIMIT', 50))  # спанов в строке лога запроса
+    REQUEST_SUMMARY_LOG = os.environ.get('REQUEST_SUMMARY_LOG', 'true').lower() == 'true'
+
+    # Логирование через очередь и фоновый поток
+    LOG_QUEUE_SIZE = int(os.environ.get('LOG_QUEUE_SIZE', 10000))  # при переполнении записи отбрасываются
+    LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 20))  # INFO-записей в секунду на место вызова, 0 - без ограничения
+    LOG_RATE_BURST = int(os.environ.get('LOG_RATE_BURST', 100))
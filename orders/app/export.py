@@ -0,0 +1,131 @@
+"""
+Потоковая выгрузка заказов в NDJSON и CSV.
+
+Строки читаются серверным курсором (yield_per) и кодируются на лету
+кусками по EXPORT_CHUNK_SIZE, поэтому память не зависит от размера таблицы.
+"""
+
+import csv
+import io
+import json
+import sys
+import zlib
+from datetime import datetime
+from decimal import Decimal
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import select
+from .models import db, UserOrders, order_conditions
+
+EXPORT_COLUMNS = [column.name for column in UserOrders.__table__.columns]
+
+# Размер куска ответа до сжатия
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        # Сумма выгружается без потери точности
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def iter_order_rows(conditions, batch_size=None):
+    """Строки заказов по возрастанию (order_time, id) через серверный курсор."""
+    batch_size = batch_size or current_app.config['ORDERS_EXPORT_BATCH_SIZE']
+    statement = (
+        select(*UserOrders.__table__.columns)
+        .where(*conditions)
+        .order_by(UserOrders.order_time, UserOrders.id)
+        .execution_options(yield_per=batch_size)
+    )
+    yield from db.session.execute(statement).mappings()
+
+
+def ndjson_chunks(rows):
+    """Строки в NDJSON: одна строка JSON на заказ."""
+    buffer = []
+    size = 0
+    for row in rows:
+        line = json.dumps(dict(row), ensure_ascii=False, default=_json_default) + '\n'
+        buffer.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def csv_chunks(rows):
+    """Строки в CSV с заголовком; positions и address - JSON в ячейке."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([_csv_value(row[column]) for column in EXPORT_COLUMNS])
+        if output.tell() >= EXPORT_CHUNK_SIZE:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate(0)
+    yield output.getvalue()
+
+
+# Формат -> (MIME-тип, кодировщик)
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_chunks),
+    'csv': ('text/csv', csv_chunks),
+}
+
+
+def export_orders(conditions, export_format='ndjson', compress=False):
+    """Выгрузка заказов кусками байт, при compress=True - в формате gzip."""
+    _, encode = EXPORT_FORMATS[export_format]
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    for chunk in encode(iter_order_rows(conditions)):
+        data = chunk.encode('utf-8')
+        if compressor is not None:
+            data = compressor.compress(data)
+        if data:
+            yield data
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+@click.command('export-orders')
+@click.option('--format', 'export_format', type=click.Choice(list(EXPORT_FORMATS)), default='ndjson')
+@click.option('--from', 'date_from', type=click.DateTime(), default=None, help='Начало периода (включительно).')
+@click.option('--to', 'date_to', type=click.DateTime(), default=None, help='Конец периода (не включается).')
+@click.option('--currency', default=None, help='Валюта оплаты.')
+@click.option('--product-id', type=int, default=None, help='Только заказы с этим продуктом.')
+@click.option('--output', default='-', help='Файл выгрузки; "-" - stdout, *.gz - со сжатием.')
+@with_appcontext
+def export_orders_command(export_format, date_from, date_to, currency, product_id, output):
+    """Выгрузить заказы в NDJSON или CSV без загрузки всей таблицы в память."""
+    conditions = order_conditions(date_from, date_to, currency, product_id)
+    chunks = export_orders(conditions, export_format, compress=output.endswith('.gz'))
+
+    if output == '-':
+        for chunk in chunks:
+            sys.stdout.buffer.write(chunk)
+        sys.stdout.buffer.flush()
+        return
+
+    with open(output, 'wb') as file:
+        for chunk in chunks:
+            file.write(chunk)
+    click.echo(f"Orders exported to {output}", err=True)
@@ -0,0 +1,239 @@
+"""
+HTTP-клиент для запросов orders -> main.
+
+Один клиент на процесс: keep-alive соединения из пула requests.Session,
+таймауты на подключение и чтение, ограниченные повторы с джиттером,
+circuit breaker и статистика задержек по эндпоинтам.
+"""
+
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from flask import current_app
+from .metrics import MAIN_REQUEST_LATENCY, MAIN_REQUEST_RETRIES, MAIN_REQUESTS_REJECTED
+from .tracing import get_request_id, record_span
+
+
+class MainServiceError(Exception):
+    """main не ответил или ответил ошибкой сервера."""
+
+
+class MainServiceUnavailable(MainServiceError):
+    """Circuit breaker разомкнут: запрос в main не выполнялся."""
+
+
+class CircuitBreaker:
+    """
+    Размыкается после failure_threshold ошибок подряд.
+
+    Пока разомкнут, запросы сразу отклоняются; через reset_timeout
+    пропускается один пробный запрос, и его успех замыкает цепь.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Можно ли выполнить запрос сейчас."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self._probing = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'half_open' if self._probing else 'open'
+
+
+class EndpointStats:
+    """Счетчики запросов и задержек одного эндпоинта."""
+
+    __slots__ = ('calls', 'errors', 'rejected', 'retries', 'total_seconds', 'max_seconds')
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.retries = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'avg_seconds': round(self.total_seconds / self.calls, 6) if self.calls else 0.0,
+            'max_seconds': round(self.max_seconds, 6),
+        }
+
+
+class MainServiceClient:
+    """Клиент main с пулом соединений, повторами и circuit breaker."""
+
+    def __init__(self, base_url: str, connect_timeout: float, read_timeout: float,
+                 retries: int, retry_backoff: float, pool_size: int, breaker: CircuitBreaker):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.breaker = breaker
+        self.pid = os.getpid()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def _endpoint_stats(self, endpoint: str) -> EndpointStats:
+        # Вызывается под _stats_lock
+        return self._stats.setdefault(endpoint, EndpointStats())
+
+    def _record(self, endpoint: str, seconds: float, error: bool) -> None:
+        with self._stats_lock:
+            stats = self._endpoint_stats(endpoint)
+            stats.calls += 1
+            stats.errors += int(error)
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+        MAIN_REQUEST_LATENCY.labels(endpoint, 'error' if error else 'ok').observe(seconds)
+        record_span('main', endpoint, seconds)
+
+    def get(self, endpoint: str, path: str, timeout=None, **kwargs) -> requests.Response:
+        """
+        GET-запрос в main.
+
+        endpoint - имя для статистики (без ID в пути), timeout - таймаут вместо
+        self.timeout. Ответы 4xx возвращаются вызывающему, ошибки соединения,
+        таймауты и 5xx повторяются до retries раз, затем выбрасывается
+        MainServiceError. ID текущего запроса передается в main.
+        """
+        request_id = get_request_id()
+        if request_id is not None:
+            kwargs['headers'] = {**(kwargs.get('headers') or {}), current_app.config['REQUEST_ID_HEADER']: request_id}
+
+        if not self.breaker.allow():
+            with self._stats_lock:
+                self._endpoint_stats(endpoint).rejected += 1
+            MAIN_REQUESTS_REJECTED.labels(endpoint).inc()
+            raise MainServiceUnavailable(f"main circuit is open, {endpoint} rejected")
+
+        timeout = self.timeout if timeout is None else timeout
+        attempt = 0
+        recorded = False
+        try:
+            while True:
+                started = time.monotonic()
+                error = None
+                try:
+                    response = self.session.get(f"{self.base_url}{path}", timeout=timeout, **kwargs)
+                    if response.status_code >= 500:
+                        error = MainServiceError(f"main {endpoint} returned {response.status_code}")
+                except requests.RequestException as e:
+                    error = MainServiceError(f"main {endpoint} failed: {e}")
+
+                self._record(endpoint, time.monotonic() - started, error=error is not None)
+
+                if error is None:
+                    recorded = True
+                    self.breaker.record_success()
+                    return response
+
+                if attempt >= self.retries:
+                    recorded = True
+                    self.breaker.record_failure()
+                    raise error
+
+                # Экспоненциальная пауза с полным джиттером
+                with self._stats_lock:
+                    self._endpoint_stats(endpoint).retries += 1
+                MAIN_REQUEST_RETRIES.labels(endpoint).inc()
+                time.sleep(random.uniform(0, self.retry_backoff * 2 ** attempt))
+                attempt += 1
+        finally:
+            # Исключение не из requests (например, gevent.Timeout) тоже неудача:
+            # иначе пробный запрос остался бы занятым и цепь не замкнулась бы
+            if not recorded:
+                self.breaker.record_failure()
+
+    def stats(self) -> dict:
+        """Состояние circuit breaker и статистика по эндпоинтам."""
+        with self._stats_lock:
+            endpoints = {name: stats.to_dict() for name, stats in self._stats.items()}
+        return {
+            'pid': self.pid,
+            'circuit': self.breaker.state,
+            'consecutive_failures': self.breaker.failures,
+            'endpoints': endpoints,
+        }
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def _create_client(config) -> MainServiceClient:
+    """Создать клиент по настройкам приложения."""
+    return MainServiceClient(
+        config['MAIN_SERVICE_URI'],
+        connect_timeout=config['MAIN_SERVICE_CONNECT_TIMEOUT'],
+        read_timeout=config['MAIN_SERVICE_TIMEOUT'],
+        retries=config['MAIN_SERVICE_RETRIES'],
+        retry_backoff=config['MAIN_SERVICE_RETRY_BACKOFF'],
+        pool_size=config['MAIN_SERVICE_POOL_SIZE'],
+        breaker=CircuitBreaker(
+            failure_threshold=config['MAIN_SERVICE_BREAKER_THRESHOLD'],
+            reset_timeout=config['MAIN_SERVICE_BREAKER_RESET'],
+        ),
+    )
+
+
+def get_main_client() -> MainServiceClient:
+    """Клиент main текущего процесса."""
+    global _client
+
+    client = _client
+    if client is None or client.pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client.pid != os.getpid():
+                _client = _create_client(current_app.config)
+            client = _client
+    return client
+
+
+def get_main_client_stats() -> dict:
+    """Статистика клиента текущего процесса."""
+    if _client is None or _client.pid != os.getpid():
+        return {'pid': os.getpid(), 'initialized': False}
+    return dict(_client.stats(), initialized=True)
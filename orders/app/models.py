@@ -5,7 +5,7 @@
 from typing import Any, Dict
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy import Numeric
+from sqlalchemy import Numeric, text
 from datetime import datetime
 
 db = SQLAlchemy()
@@ -15,9 +15,20 @@ class UserOrders(db.Model):
     """Модель для хранения заказов пользователей."""
 
     __tablename__ = 'user_orders'
+    # Помесячные партиции по времени заказа (см. partitions.py);
+    # ключ секционирования обязан входить в первичный ключ
+    __table_args__ = (
+        # Keyset-пагинация истории заказов: (order_time, id), в том числе в рамках валюты
+        db.Index('ix_user_orders_order_time_id', 'order_time', 'id'),
+        db.Index('ix_user_orders_currency_order_time_id', 'payment_currency', 'order_time', 'id'),
+        # Фильтр по продукту: positions @> '[{"product_id": N}]'
+        db.Index('ix_user_orders_positions', 'positions',
+                 postgresql_using='gin', postgresql_ops={'positions': 'jsonb_path_ops'}),
+        {'postgresql_partition_by': 'RANGE (order_time)'},
+    )
 
-    id = db.Column(db.Integer, primary_key=True)
-    order_time = db.Column(db.DateTime, nullable=False, default=datetime.now)  # Время заказа
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    order_time = db.Column(db.DateTime, primary_key=True, default=datetime.now)  # Время заказа
     payment_sum = db.Column(Numeric(12, 6), nullable=False)  # Итоговая сумма с 6 знаками после запятой
     payment_currency = db.Column(db.String(32), nullable=True, default='LTC')   # Валюта, LTC по дефолту
     positions = db.Column(JSONB, nullable=False)  # Все позиции
@@ -34,4 +45,60 @@ class UserOrders(db.Model):
             "positions": self.positions,
             "address": self.address,
             "paid": self.paid
-        }
\ No newline at end of file
+        }
+
+
+def order_conditions(date_from=None, date_to=None, currency=None, product_id=None) -> list:
+    """Условия выборки заказов: период [date_from, date_to), валюта, продукт."""
+    conditions = []
+    # Условия по order_time отсекают ненужные партиции
+    if date_from:
+        conditions.append(UserOrders.order_time >= date_from)
+    if date_to:
+        conditions.append(UserOrders.order_time < date_to)
+    if currency:
+        conditions.append(UserOrders.payment_currency == currency)
+    if product_id is not None:
+        conditions.append(UserOrders.positions.contains([{'product_id': product_id}]))
+    return conditions
+
+
+def ensure_order_indexes() -> None:
+    """
+    Индексы user_orders для уже созданных таблиц.
+
+    create_all не меняет существующие таблицы, поэтому индексы создаются
+    явно (для новых таблиц это no-op); на секционированной таблице
+    они создаются и во всех партициях.
+    """
+    connection = db.session.connection()
+    # Заменен составным индексом (order_time, id)
+    connection.execute(text("DROP INDEX IF EXISTS ix_user_orders_order_time"))
+    for index in UserOrders.__table__.indexes:
+        index.create(connection, checkfirst=True)
+    db.session.commit()
+
+
+class OrderEvent(db.Model):
+    """Событие заказа в outbox: пишется в одной транзакции с заказом."""
+
+    __tablename__ = 'order_events'
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    order_id = db.Column(db.Integer, nullable=False)
+    payload = db.Column(JSONB, nullable=False)  # Данные события для main
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+
+
+class SalesRollup(db.Model):
+    """Продажи продукта в валюте за час: обновляются при каждом заказе."""
+
+    __tablename__ = 'sales_rollups'
+
+    bucket = db.Column(db.DateTime, primary_key=True)  # Начало часа
+    product_id = db.Column(db.Integer, primary_key=True)
+    currency = db.Column(db.String(32), primary_key=True)
+    product_name = db.Column(db.String(255), nullable=False, default='')  # Последнее известное название
+    quantity = db.Column(db.Integer, nullable=False, default=0)  # Продано штук
+    revenue = db.Column(Numeric(18, 6), nullable=False, default=0)  # Выручка
+    orders = db.Column(db.Integer, nullable=False, default=0)  # Заказов с продуктом
@@ -0,0 +1,264 @@
+"""
+Групповая запись заказов (group commit).
+
+В обычном режиме каждый заказ - отдельная транзакция и отдельный fsync.
+При ORDER_GROUP_COMMIT заказы одновременных запросов собираются
+в течение ORDER_GROUP_COMMIT_WINDOW_MS и вставляются одним многострочным
+INSERT в одной транзакции вместе с их событиями.
+Запрос ждет коммита своей пачки и получает настоящий id заказа.
+Если пачка не записалась, ее заказы записываются по одному: ошибку
+получает только заказ, из-за которого она упала.
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
+from sqlalchemy import insert, text
+from .models import db, UserOrders, OrderEvent
+from .outbox import add_order_event, order_event_values, outbox_wakeup
+from .rollups import apply_sales_rollups
+from .tracing import get_request_id
+
+
+def _order_values(order):
+    """Значения колонок заказа без id."""
+    return {
+        column.key: getattr(order, column.key)
+        for column in UserOrders.__table__.columns
+        if column.key != 'id'
+    }
+
+
+def insert_order(order, products, request_id=None):
+    """Записать один заказ и его событие отдельной транзакцией."""
+    try:
+        db.session.add(order)
+        # id заказа нужен событию, которое сохраняется в той же транзакции
+        db.session.flush()
+        add_order_event(order, products, request_id)
+        apply_sales_rollups([order])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return order.id
+
+
+def insert_orders(orders, products_list, request_ids=None):
+    """
+    Записать пачку заказов и их событий одной транзакцией.
+
+    request_ids - ID HTTP-запросов заказов для событий.
+    Возвращает id заказов в порядке входного списка.
+    """
+    request_ids = request_ids or [None] * len(orders)
+    try:
+        # id берутся из последовательности заранее: INSERT не нужен RETURNING,
+        # а соответствие id заказам не зависит от порядка строк в ответе
+        order_ids = db.session.execute(
+            text("SELECT nextval(pg_get_serial_sequence('user_orders', 'id')) FROM generate_series(1, :count)"),
+            {'count': len(orders)}
+        ).scalars().all()
+
+        db.session.execute(
+            insert(UserOrders),
+            [dict(_order_values(order), id=order_id) for order, order_id in zip(orders, order_ids)]
+        )
+        db.session.execute(
+            insert(OrderEvent),
+            [
+                order_event_values(order_id, products, request_id)
+                for order_id, products, request_id in zip(order_ids, products_list, request_ids)
+            ]
+        )
+        apply_sales_rollups(orders)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return order_ids
+
+
+class _PendingOrder:
+    """Заказ, ожидающий коммита своей пачки."""
+
+    __slots__ = ('order', 'products', 'request_id', 'event', 'order_id', 'error', 'taken', 'cancelled')
+
+    def __init__(self, order, products, request_id=None):
+        self.order = order
+        self.products = products
+        self.request_id = request_id
+        self.event = threading.Event()
+        self.order_id = None
+        self.error = None
+        self.taken = False
+        self.cancelled = False
+
+
+class OrderBatcher:
+    """Собирает заказы потоков воркера в пачки и записывает их одним запросом."""
+
+    def __init__(self, app: Flask, window: float, max_batch: int, timeout: float):
+        self.app = app
+        self.window = window
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        # Взятие заказа в пачку и его отмена по таймауту исключают друг друга
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name='order-batcher', daemon=True).start()
+
+    def submit(self, order, products):
+        """
+        Поставить заказ в пачку и дождаться ее коммита. Возвращает id заказа.
+
+        timeout ограничивает только ожидание в очереди: заказ, уже взятый
+        в пачку, может быть записан, поэтому его результат ждется до конца.
+        """
+        # ID запроса берется здесь: пачку записывает поток без контекста запроса
+        pending = _PendingOrder(order, products, get_request_id())
+        self._queue.put(pending)
+
+        if not pending.event.wait(self.timeout):
+            with self._lock:
+                pending.cancelled = not pending.taken
+            if pending.cancelled:
+                raise TimeoutError(f"Order was not taken into a batch within {self.timeout}s")
+            pending.event.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.order_id
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch):
+        with self._lock:
+            batch = [pending for pending in batch if not pending.cancelled]
+            for pending in batch:
+                pending.taken = True
+        if not batch:
+            return
+
+        try:
+            with self.app.app_context():
+                order_ids = insert_orders(
+                    [pending.order for pending in batch],
+                    [pending.products for pending in batch],
+                    [pending.request_id for pending in batch]
+                )
+            for pending, order_id in zip(batch, order_ids):
+                pending.order_id = order_id
+        except Exception as e:
+            self.app.logger.error(f"Order batch of {len(batch)} failed, retrying one by one: {e}", exc_info=True)
+            self._flush_one_by_one(batch)
+        finally:
+            outbox_wakeup.set()
+            for pending in batch:
+                pending.event.set()
+
+    def _flush_one_by_one(self, batch):
+        """Записать заказы упавшей пачки по одному: ошибку получают только сбойные."""
+        # id, заранее взятые для пачки, не переиспользуются (nextval не откатывается):
+        # каждый заказ получает новый id из последовательности в своей транзакции
+        for pending in batch:
+            try:
+                with self.app.app_context():
+                    pending.order_id = insert_order(pending.order, pending.products, pending.request_id)
+            except Exception as e:
+                self.app.logger.error(f"Order of batch failed: {e}", exc_info=True)
+                pending.error = e
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_order_batcher() -> OrderBatcher:
+    """Групповая запись заказов текущего процесса."""
+    global _batcher
+
+    batcher = _batcher
+    if batcher is None or batcher.pid != os.getpid():
+        with _batcher_lock:
+            if _batcher is None or _batcher.pid != os.getpid():
+                config = current_app.config
+                _batcher = OrderBatcher(
+                    current_app._get_current_object(),
+                    window=config['ORDER_GROUP_COMMIT_WINDOW_MS'] / 1000,
+                    max_batch=config['ORDER_GROUP_COMMIT_MAX_BATCH'],
+                    timeout=config['ORDER_GROUP_COMMIT_TIMEOUT']
+                )
+            batcher = _batcher
+    return batcher
+
+
+def save_order(order, products):
+    """Записать заказ в режиме, выбранном в ORDER_GROUP_COMMIT. Возвращает id."""
+    if current_app.config['ORDER_GROUP_COMMIT']:
+        order.id = get_order_batcher().submit(order, products)
+    else:
+        insert_order(order, products)
+    return order.id
+
+
+@click.command('bench-orders')
+@click.option('--orders', 'count', type=int, default=500, help='Число заказов на каждый режим.')
+@click.option('--concurrency', type=int, default=16, help='Число одновременных потоков.')
+@with_appcontext
+def bench_orders_command(count, concurrency):
+    """Сравнить пропускную способность записи заказов: по одному и группами."""
+    app = current_app._get_current_object()
+    batcher = get_order_batcher()
+    order_ids = []
+
+    def make_order():
+        return UserOrders(
+            order_time=datetime.now(),
+            payment_sum=0,
+            payment_currency='LTC',
+            positions=[],
+            address={'benchmark': True},
+            paid=False
+        )
+
+    def single(_):
+        with app.app_context():
+            return insert_order(make_order(), [])
+
+    def grouped(_):
+        return batcher.submit(make_order(), [])
+
+    try:
+        for name, func in (('single', single), ('group', grouped)):
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                order_ids.extend(executor.map(func, range(count)))
+            elapsed = time.monotonic() - started
+            click.echo(f"{name}: {count} orders in {elapsed:.3f}s, {count / elapsed:.1f} orders/s")
+    finally:
+        # Тестовые заказы и их события удаляются; события без продуктов main игнорирует,
+        # итоги продаж не меняются - позиций у тестовых заказов нет
+        OrderEvent.query.filter(OrderEvent.order_id.in_(order_ids)).delete(synchronize_session=False)
+        UserOrders.query.filter(UserOrders.id.in_(order_ids)).delete(synchronize_session=False)
+        db.session.commit()
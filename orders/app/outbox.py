@@ -0,0 +1,77 @@
+"""
+Доставка событий заказов в main через outbox.
+
+make_order сохраняет событие в таблицу order_events в той же транзакции,
+что и заказ. Фоновый поток переносит события пачками в Redis Stream,
+откуда их читает main. Событие удаляется из outbox только после XADD,
+поэтому при падении оно будет отправлено повторно, а не потеряно.
+
+После XADD событие хранится только в потоке, поэтому поток живет в
+отдельном Redis (ORDER_EVENTS_REDIS_URL) с AOF и noeviction и не обрезается
+по длине: main удаляет события сам после XACK.
+"""
+
+import json
+import threading
+from flask import current_app
+from .models import db, OrderEvent
+from .redis_pool import get_events_redis_client
+from .tracing import get_request_id
+
+# Будит поток доставки сразу после нового заказа, не дожидаясь интервала
+outbox_wakeup = threading.Event()
+
+
+def order_event_values(order_id, products, request_id=None):
+    """Поля строки order_events для заказа; request_id связывает событие с логами заказа."""
+    payload = {'order_id': order_id, 'products': products}
+    if request_id is not None:
+        payload['request_id'] = request_id
+    return {'order_id': order_id, 'payload': payload}
+
+
+def add_order_event(order, products, request_id=None):
+    """Добавить событие заказа в текущую транзакцию (id заказа уже получен)."""
+    request_id = request_id or get_request_id()
+    db.session.add(OrderEvent(**order_event_values(order.id, products, request_id)))
+
+
+def publish_order_events(batch_size=None):
+    """
+    Перенести одну пачку событий из outbox в Redis Stream.
+
+    Строки блокируются с SKIP LOCKED, поэтому воркеры не отправляют
+    одни и те же события одновременно. Возвращает число отправленных событий.
+    """
+    batch_size = batch_size or current_app.config['ORDER_EVENTS_RELAY_BATCH']
+
+    events = (
+        OrderEvent.query
+        .order_by(OrderEvent.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not events:
+        db.session.rollback()
+        return 0
+
+    try:
+        pipe = get_events_redis_client().pipeline(transaction=False)
+        for event in events:
+            pipe.xadd(
+                current_app.config['ORDER_EVENTS_STREAM'],
+                {'order_id': event.order_id, 'payload': json.dumps(event.payload)}
+            )
+        pipe.execute()
+
+        OrderEvent.query.filter(
+            OrderEvent.id.in_([event.id for event in events])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    return len(events)
+
@@ -0,0 +1,241 @@
+"""
+Помесячные партиции user_orders и их архивация.
+
+user_orders секционирована по order_time (RANGE). Партиции на текущий
+и ORDERS_PARTITIONS_AHEAD следующих месяцев создаются при старте и фоновым
+потоком; партиция по умолчанию принимает заказы вне созданных диапазонов.
+Старая несекционированная таблица переносится только командой partition-orders.
+Старые партиции выгружаются в сжатый NDJSON и отсоединяются от таблицы.
+"""
+
+import gzip
+import os
+from datetime import date, datetime
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import text
+from .models import db, UserOrders
+from .export import ndjson_chunks
+
+# Ключ advisory lock: обслуживание партиций выполняет один воркер за раз
+PARTITIONS_LOCK_KEY = 7301001
+
+DEFAULT_PARTITION = 'user_orders_default'
+
+
+def _month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def _add_months(value: date, months: int) -> date:
+    month = value.month - 1 + months
+    return date(value.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """Имя партиции месяца: user_orders_y2025m01."""
+    return f"user_orders_y{month.year}m{month.month:02d}"
+
+
+def _partition_month(name: str):
+    """Месяц партиции по имени или None для прочих таблиц."""
+    try:
+        return date(int(name[-7:-3]), int(name[-2:]), 1)
+    except ValueError:
+        return None
+
+
+def _lock():
+    db.session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {'key': PARTITIONS_LOCK_KEY})
+
+
+def is_partitioned() -> bool:
+    """Секционирована ли уже user_orders."""
+    return bool(db.session.execute(text("""
+        SELECT 1 FROM pg_partitioned_table p
+        JOIN pg_class c ON c.oid = p.partrelid
+        WHERE c.relname = 'user_orders'
+    """)).scalar())
+
+
+def list_partitions() -> list:
+    """Месячные партиции user_orders по возрастанию: [(месяц, имя)]."""
+    names = db.session.execute(text("""
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE p.relname = 'user_orders'
+    """)).scalars()
+    return sorted(
+        (month, name) for name in names
+        if (month := _partition_month(name)) is not None
+    )
+
+
+def _create_partition(month: date) -> None:
+    db.session.execute(text(
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(month)}" PARTITION OF user_orders '
+        f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_add_months(month, 1).isoformat()}')"
+    ))
+
+
+def _create_partitions(start: date, end: date) -> None:
+    month = start
+    while month <= end:
+        _create_partition(month)
+        month = _add_months(month, 1)
+    db.session.execute(text(f'CREATE TABLE IF NOT EXISTS "{DEFAULT_PARTITION}" PARTITION OF user_orders DEFAULT'))
+
+
+def _migrate_to_partitioned(ahead: int) -> int:
+    """
+    Перенести заказы из несекционированной user_orders в секционированную.
+
+    Выполняется в одной транзакции: старая таблица переименовывается,
+    создается новая с партициями на весь диапазон заказов, данные копируются,
+    последовательность id продолжается с максимального id. Возвращает число заказов.
+    """
+    db.session.execute(text("ALTER TABLE user_orders RENAME TO user_orders_unpartitioned"))
+    db.session.execute(text("ALTER SEQUENCE IF EXISTS user_orders_id_seq RENAME TO user_orders_unpartitioned_id_seq"))
+    db.session.execute(text("ALTER INDEX IF EXISTS user_orders_pkey RENAME TO user_orders_unpartitioned_pkey"))
+    # Индексы старой таблицы носят имена индексов новой и мешают ее создать;
+    # таблица удаляется после копирования, поэтому индексы не нужны
+    old_indexes = db.session.execute(text("""
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = current_schema() AND tablename = 'user_orders_unpartitioned'
+          AND indexname <> 'user_orders_unpartitioned_pkey'
+    """)).scalars().all()
+    for name in old_indexes:
+        db.session.execute(text(f'DROP INDEX "{name}"'))
+    UserOrders.__table__.create(db.session.connection())
+
+    first = db.session.execute(text("SELECT min(order_time) FROM user_orders_unpartitioned")).scalar()
+    current = _month_start(datetime.now())
+    _create_partitions(_month_start(first) if first else current, _add_months(current, ahead))
+
+    columns = ', '.join(column.name for column in UserOrders.__table__.columns)
+    copied = db.session.execute(text(
+        f"INSERT INTO user_orders ({columns}) SELECT {columns} FROM user_orders_unpartitioned"
+    )).rowcount
+    db.session.execute(text(
+        "SELECT setval(pg_get_serial_sequence('user_orders', 'id'), "
+        "(SELECT coalesce(max(id), 0) + 1 FROM user_orders), false)"
+    ))
+    db.session.execute(text("DROP TABLE user_orders_unpartitioned"))
+    return copied
+
+
+def ensure_order_partitions(ahead=None, migrate=False) -> bool:
+    """
+    Создать партиции на текущий и следующие месяцы.
+
+    create_all не меняет существующие таблицы, поэтому старая несекционированная
+    user_orders переносится только с migrate=True (команда partition-orders):
+    перенос копирует все заказы под блокировкой и не запускается при старте
+    воркеров. Возвращает False, если таблица не секционирована и перенос не запрошен.
+    """
+    ahead = current_app.config['ORDERS_PARTITIONS_AHEAD'] if ahead is None else ahead
+    try:
+        _lock()
+        if is_partitioned():
+            current = _month_start(datetime.now())
+            _create_partitions(current, _add_months(current, ahead))
+        elif migrate:
+            copied = _migrate_to_partitioned(ahead)
+            current_app.logger.info(f"user_orders migrated to monthly partitions, {copied} orders copied")
+        else:
+            db.session.rollback()
+            current_app.logger.error(
+                "user_orders is not partitioned, partitions were not created: "
+                "run 'flask partition-orders' to migrate it"
+            )
+            return False
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return True
+
+
+def _archive_rows(name: str):
+    """Строки партиции по возрастанию id, читаются потоком."""
+    result = db.session.execute(
+        text(f'SELECT * FROM "{name}" ORDER BY id')
+        .execution_options(yield_per=current_app.config['ORDERS_EXPORT_BATCH_SIZE'])
+    )
+    yield from result.mappings()
+
+
+def archive_partition(month: date, archive_dir: str, drop: bool = False) -> int:
+    """
+    Выгрузить партицию в <archive_dir>/<имя>.ndjson.gz и отсоединить ее.
+
+    Файл пишется во временный и переименовывается после полной записи.
+    С drop=True отсоединенная таблица удаляется. Возвращает число заказов.
+    """
+    name = partition_name(month)
+    os.makedirs(archive_dir, exist_ok=True)
+    path = os.path.join(archive_dir, f"{name}.ndjson.gz")
+
+    count = 0
+
+    def counted_rows():
+        nonlocal count
+        for row in _archive_rows(name):
+            count += 1
+            yield row
+
+    # Тот же формат, что у выгрузки export-orders
+    with gzip.open(f"{path}.tmp", 'wt', encoding='utf-8') as archive:
+        for chunk in ndjson_chunks(counted_rows()):
+            archive.write(chunk)
+    os.replace(f"{path}.tmp", path)
+
+    try:
+        _lock()
+        db.session.execute(text(f'ALTER TABLE user_orders DETACH PARTITION "{name}"'))
+        if drop:
+            db.session.execute(text(f'DROP TABLE "{name}"'))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return count
+
+
+def archive_old_partitions(months=None, archive_dir=None, drop=False) -> list:
+    """Архивировать партиции старше months месяцев. Возвращает [(имя, заказов)]."""
+    config = current_app.config
+    months = config['ORDERS_ARCHIVE_AFTER_MONTHS'] if months is None else months
+    archive_dir = archive_dir or config['ORDERS_ARCHIVE_DIR']
+    cutoff = _add_months(_month_start(datetime.now()), -months)
+
+    archived = []
+    for month, name in list_partitions():
+        if month < cutoff:
+            archived.append((name, archive_partition(month, archive_dir, drop)))
+    return archived
+
+
+@click.command('partition-orders')
+@click.option('--ahead', type=int, default=None, help='На сколько месяцев вперед создать партиции.')
+@with_appcontext
+def partition_orders_command(ahead):
+    """Секционировать user_orders и создать партиции на следующие месяцы."""
+    ensure_order_partitions(ahead, migrate=True)
+    for month, name in list_partitions():
+        click.echo(name)
+
+
+@click.command('archive-orders')
+@click.option('--months', type=int, default=None, help='Архивировать партиции старше N месяцев.')
+@click.option('--dir', 'archive_dir', default=None, help='Каталог для архивов.')
+@click.option('--drop', is_flag=True, help='Удалить таблицу партиции после отсоединения.')
+@with_appcontext
+def archive_orders_command(months, archive_dir, drop):
+    """Выгрузить старые партиции заказов в .ndjson.gz и отсоединить их."""
+    archived = archive_old_partitions(months, archive_dir, drop)
+    for name, count in archived:
+        click.echo(f"{name}: {count} orders archived")
+    click.echo(f"Archived {len(archived)} partitions")
@@ -0,0 +1,142 @@
+"""
+Общий пул соединений с Redis.
+
+Один пул на процесс: gunicorn-воркеры получают собственный пул после fork,
+а потоки внутри воркера делят его между собой. Поток событий заказов
+живет в отдельном Redis, для него свой пул (get_events_redis_client).
+"""
+
+import os
+import threading
+import time
+import redis
+from flask import current_app
+from .metrics import observe_redis_command
+
+
+class InstrumentedConnectionPool(redis.BlockingConnectionPool):
+    """Блокирующий пул соединений со счетчиками ожиданий."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.waits = 0
+        self.wait_seconds = 0.0
+
+    def get_connection(self, *args, **kwargs):
+        """Получить соединение, учитывая случаи, когда свободных не было."""
+        if not self.pool.empty():
+            return super().get_connection(*args, **kwargs)
+
+        started = time.monotonic()
+        try:
+            return super().get_connection(*args, **kwargs)
+        finally:
+            with self._stats_lock:
+                self.waits += 1
+                self.wait_seconds += time.monotonic() - started
+
+    def stats(self) -> dict:
+        """Текущее состояние пула."""
+        created = len(self._connections)
+        idle = sum(1 for connection in list(self.pool.queue) if connection is not None)
+        with self._stats_lock:
+            waits = self.waits
+            wait_seconds = self.wait_seconds
+        return {
+            "pid": self.pid,
+            "max_connections": self.max_connections,
+            "created": created,
+            "in_use": created - idle,
+            "idle": idle,
+            "waits": waits,
+            "wait_seconds": round(wait_seconds, 6),
+        }
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+    """Pipeline, выполнение которого учитывается в метриках одной командой."""
+
+    def execute(self, raise_on_error=True):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(raise_on_error)
+            failed = False
+            return result
+        finally:
+            command = 'MULTI' if self.transaction else 'PIPELINE'
+            observe_redis_command(command, time.perf_counter() - started, failed)
+
+
+class InstrumentedRedis(redis.Redis):
+    """Клиент Redis с замером времени каждой команды."""
+
+    def execute_command(self, *args, **options):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute_command(*args, **options)
+            failed = False
+            return result
+        finally:
+            observe_redis_command(str(args[0]).upper(), time.perf_counter() - started, failed)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+
+_pool = None
+_client = None
+_pool_lock = threading.Lock()
+
+
+def _create_pool(config, url) -> InstrumentedConnectionPool:
+    """Создать пул по настройкам приложения."""
+    return InstrumentedConnectionPool.from_url(
+        url,
+        decode_responses=True,
+        max_connections=config['REDIS_MAX_CONNECTIONS'],
+        timeout=config['REDIS_POOL_TIMEOUT'],
+        health_check_interval=config['REDIS_HEALTH_CHECK_INTERVAL'],
+        socket_timeout=config['REDIS_SOCKET_TIMEOUT'],
+        socket_connect_timeout=config['REDIS_SOCKET_CONNECT_TIMEOUT'],
+        socket_keepalive=True,
+    )
+
+
+def get_redis_client() -> redis.Redis:
+    """Клиент Redis поверх общего пула текущего процесса."""
+    global _pool, _client
+
+    pool = _pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _pool is None or _pool.pid != os.getpid():
+                _pool = _create_pool(current_app.config, current_app.config['REDIS_URL'])
+                _client = InstrumentedRedis(connection_pool=_pool)
+    return _client
+
+
+_events_pool = None
+_events_client = None
+
+
+def get_events_redis_client() -> redis.Redis:
+    """Клиент Redis с потоком событий заказов (ORDER_EVENTS_REDIS_URL), свой пул процесса."""
+    global _events_pool, _events_client
+
+    pool = _events_pool
+    if pool is None or pool.pid != os.getpid():
+        with _pool_lock:
+            if _events_pool is None or _events_pool.pid != os.getpid():
+                _events_pool = _create_pool(current_app.config, current_app.config['ORDER_EVENTS_REDIS_URL'])
+                _events_client = InstrumentedRedis(connection_pool=_events_pool)
+    return _events_client
+
+
+def get_pool_stats() -> dict:
+    """Статистика пула текущего процесса."""
+    if _pool is None or _pool.pid != os.getpid():
+        return {"pid": os.getpid(), "initialized": False}
+    return dict(_pool.stats(), initialized=True)
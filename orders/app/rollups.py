@@ -0,0 +1,218 @@
+"""
+Почасовые итоги продаж по продуктам и валютам.
+
+Строки sales_rollups обновляются в той же транзакции, что и заказ
+(INSERT ... ON CONFLICT DO UPDATE с приращениями), поэтому отчеты читают
+O(часов) строк, а не разбирают positions каждого заказа.
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+from decimal import Decimal
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert
+from .models import db, SalesRollup, UserOrders
+from .partitions import DEFAULT_PARTITION, is_partitioned, list_partitions
+
+# Группировка отчета -> шаг date_trunc (None - итог за период)
+REPORT_GROUPS = {'hour': 'hour', 'day': 'day', 'total': None}
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    """Начало часа."""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _rollup_rows(orders) -> list:
+    """Приращения итогов для заказов, сведенные по (час, продукт, валюта)."""
+    totals = defaultdict(lambda: {'quantity': 0, 'revenue': Decimal(0), 'orders': 0, 'product_name': ''})
+
+    for order in orders:
+        bucket = hour_bucket(order.order_time)
+        for position in order.positions:
+            key = (bucket, position['product_id'], order.payment_currency or '')
+            row = totals[key]
+            row['quantity'] += position.get('quantity', 0)
+            row['revenue'] += Decimal(str(position.get('total', 0)))
+            row['orders'] += 1
+            row['product_name'] = position.get('name', '')
+
+    # Ключи по порядку: одновременные транзакции блокируют строки одинаково, без взаимоблокировок
+    return [
+        dict(bucket=bucket, product_id=product_id, currency=currency, **values)
+        for (bucket, product_id, currency), values in sorted(totals.items())
+    ]
+
+
+def apply_sales_rollups(orders) -> None:
+    """Добавить заказы к итогам в текущей транзакции."""
+    rows = _rollup_rows(orders)
+    if not rows:
+        return
+
+    statement = insert(SalesRollup).values(rows)
+    db.session.execute(statement.on_conflict_do_update(
+        index_elements=[SalesRollup.bucket, SalesRollup.product_id, SalesRollup.currency],
+        set_={
+            'quantity': SalesRollup.quantity + statement.excluded.quantity,
+            'revenue': SalesRollup.revenue + statement.excluded.revenue,
+            'orders': SalesRollup.orders + statement.excluded.orders,
+            'product_name': statement.excluded.product_name,
+        }
+    ))
+
+
+def get_sales_report(date_from, date_to, group='hour', product_id=None, currency=None) -> list:
+    """Продажи за [date_from, date_to) по продуктам и валютам с шагом group."""
+    step = REPORT_GROUPS[group]
+    columns = [SalesRollup.product_id, SalesRollup.currency]
+    if step:
+        columns.insert(0, func.date_trunc(step, SalesRollup.bucket).label('bucket'))
+
+    query = db.session.query(
+        *columns,
+        func.max(SalesRollup.product_name).label('product_name'),
+        func.sum(SalesRollup.quantity).label('quantity'),
+        func.sum(SalesRollup.revenue).label('revenue'),
+        func.sum(SalesRollup.orders).label('orders'),
+    ).filter(
+        SalesRollup.bucket >= hour_bucket(date_from),
+        SalesRollup.bucket < date_to
+    )
+    if product_id is not None:
+        query = query.filter(SalesRollup.product_id == product_id)
+    if currency:
+        query = query.filter(SalesRollup.currency == currency)
+
+    query = query.group_by(*columns).order_by(*columns)
+
+    return [
+        {
+            'bucket': row.bucket.isoformat() if step else None,
+            'product_id': row.product_id,
+            'product_name': row.product_name,
+            'currency': row.currency,
+            'quantity': int(row.quantity),
+            'revenue': float(row.revenue),
+            'orders': int(row.orders),
+        }
+        for row in query
+    ]
+
+
+# Пересчет итогов за период одним запросом, без загрузки заказов в Python
+REBUILD_SALES_ROLLUPS_SQL = """
+INSERT INTO sales_rollups (bucket, product_id, currency, product_name, quantity, revenue, orders)
+SELECT date_trunc('hour', o.order_time),
+       (p->>'product_id')::int,
+       coalesce(o.payment_currency, ''),
+       max(coalesce(p->>'name', '')),
+       sum(coalesce((p->>'quantity')::int, 0)),
+       sum(coalesce((p->>'total')::numeric, 0)),
+       count(*)
+FROM user_orders o
+CROSS JOIN LATERAL jsonb_array_elements(o.positions) p
+WHERE o.order_time >= :date_from AND o.order_time < :date_to
+GROUP BY 1, 2, 3
+"""
+
+
+def rebuild_earliest():
+    """
+    Самое раннее время, с которого итоги можно пересчитать, или None без заказов.
+
+    Это начало самой старой подключенной партиции: заказы более ранних
+    месяцев архивированы и отсоединены, их итоги не из чего восстановить.
+    Заказы партиции по умолчанию могут быть старше, их час тоже учитывается.
+    """
+    if is_partitioned():
+        partitions = list_partitions()
+        if partitions:
+            month = partitions[0][0]
+            earliest = datetime(month.year, month.month, 1)
+            default_first = db.session.execute(text(
+                f'SELECT min(order_time) FROM "{DEFAULT_PARTITION}"'
+            )).scalar()
+            if default_first is not None:
+                earliest = min(earliest, hour_bucket(default_first))
+            return earliest
+    first = db.session.query(func.min(UserOrders.order_time)).scalar()
+    return hour_bucket(first) if first else None
+
+
+def _next_month(moment: datetime) -> datetime:
+    """Начало следующего месяца."""
+    if moment.month == 12:
+        return datetime(moment.year + 1, 1, 1)
+    return datetime(moment.year, moment.month + 1, 1)
+
+
+def _rebuild_window(date_from, date_to) -> int:
+    """Пересчитать итоги за [date_from, date_to) одной транзакцией под блокировкой таблицы итогов."""
+    try:
+        db.session.execute(text("LOCK TABLE sales_rollups IN EXCLUSIVE MODE"))
+        SalesRollup.query.filter(
+            SalesRollup.bucket >= date_from,
+            SalesRollup.bucket < date_to
+        ).delete(synchronize_session=False)
+        rows = db.session.execute(
+            text(REBUILD_SALES_ROLLUPS_SQL),
+            {'date_from': date_from, 'date_to': date_to}
+        ).rowcount
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+    return rows
+
+
+def rebuild_sales_rollups(date_from, date_to) -> int:
+    """
+    Пересчитать итоги за [date_from, date_to) по истории заказов.
+
+    Границы выравниваются по часам. Период пересчитывается помесячными
+    окнами, каждое - отдельной транзакцией: таблица итогов блокируется только
+    на время окна, новые заказы ждут его окончания и не теряются и не
+    учитываются дважды. Период раньше rebuild_earliest() не принимается
+    (ValueError), без заказов ничего не меняется. Возвращает число строк итогов.
+    """
+    date_from = hour_bucket(date_from)
+    if date_to != hour_bucket(date_to):
+        date_to = hour_bucket(date_to) + timedelta(hours=1)
+
+    earliest = rebuild_earliest()
+    if earliest is None:
+        return 0
+    if date_from < earliest:
+        raise ValueError(f"Sales rollups can be rebuilt only from {earliest}: earlier orders are archived")
+
+    rows = 0
+    window_from = date_from
+    while window_from < date_to:
+        window_to = min(_next_month(window_from), date_to)
+        rows += _rebuild_window(window_from, window_to)
+        window_from = window_to
+    return rows
+
+
+@click.command('rebuild-sales-rollups')
+@click.option('--from', 'date_from', type=click.DateTime(), default=None,
+              help='Начало периода (по умолчанию - начало самой старой подключенной партиции).')
+@click.option('--to', 'date_to', type=click.DateTime(), default=None, help='Конец периода (по умолчанию - текущий час).')
+@with_appcontext
+def rebuild_sales_rollups_command(date_from, date_to):
+    """Пересчитать почасовые итоги продаж по истории заказов помесячно."""
+    date_from = date_from or rebuild_earliest()
+    if date_from is None:
+        click.echo("No orders to rebuild sales rollups from")
+        return
+    date_to = date_to or hour_bucket(datetime.now()) + timedelta(hours=1)
+    try:
+        rows = rebuild_sales_rollups(date_from, date_to)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint='--from')
+    current_app.logger.info(f"Sales rollups rebuilt from {date_from} to {date_to}, {rows} rows")
+    click.echo(f"Rebuilt {rows} sales rollup rows")
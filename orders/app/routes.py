@@ -1,14 +1,21 @@
 """Основные маршруты."""
 
-from flask import Blueprint, request, jsonify, current_app, Response
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from decimal import Decimal
-from .models import db, UserOrders
-from datetime import datetime
-import requests
-from .utils import add_to_cart, remove_from_cart, get_cart, clear_cart, get_cart_total, decrement_from_cart, get_redis_connection, get_cart_key, update_cart_ttl
-import json
+from .models import db, UserOrders, order_conditions
+from datetime import datetime, timedelta
+from sqlalchemy import tuple_
+from .utils import add_to_cart, remove_from_cart, get_cart_snapshot, clear_cart, decrement_from_cart, toggle_cart_addition, remember_cart_id
+from .redis_pool import get_pool_stats
+from .catalog import get_product_info
+from .main_client import MainServiceError, get_main_client_stats
+from .outbox import outbox_wakeup
+from .order_batcher import save_order
+from .export import EXPORT_FORMATS, export_orders
+from .rollups import REPORT_GROUPS, get_sales_report
 
 bp = Blueprint('orders', __name__)
+bp.after_request(remember_cart_id)
 
 
 @bp.route('/cart', methods=['POST'])
@@ -21,25 +28,30 @@ def add_to_cart_route():
 
         product_id = data.get('product_id')
 
-        if not product_id:
+        if product_id is None:
             return jsonify({'error': 'Product ID is required'}), 400
 
-        # Получаем информацию о продукте из main сервиса
-        response = requests.get(f'{current_app.config.get("MAIN_SERVICE_URI")}/get_product/{product_id}')
+        # Только целое число: 1.5, true или "01" дали бы в корзине поле, которое не разобрать
+        if isinstance(product_id, bool) or not isinstance(product_id, int) or product_id <= 0:
+            return jsonify({'error': 'product_id must be a positive integer'}), 400
 
-        if response.status_code == 404:
-            return jsonify({'error': 'Product does not exist'}), 404
+        # Информация о продукте из локальной копии каталога main
+        try:
+            product_info = get_product_info(product_id)
+        except MainServiceError as e:
+            current_app.logger.warning(f"Product {product_id} lookup in main failed: {e}")
+            return jsonify({'error': 'Catalog service unavailable'}), 503
 
-        if response.status_code == 200:
-            product_info = response.json()['product']
+        if product_info is None:
+            return jsonify({'error': 'Product does not exist'}), 404
 
-            # Добавляем в корзину (увеличиваем количество если уже есть)
-            result = add_to_cart(product_id, product_info)
+        # Добавляем в корзину (увеличиваем количество если уже есть)
+        result = add_to_cart(product_id, product_info)
 
-            if result == 'added':
-                return jsonify({'success': 'Product added to cart'}), 200
-            else:
-                return jsonify({'success': 'Product quantity increased in cart'}), 200
+        if result == 'added':
+            return jsonify({'success': 'Product added to cart'}), 200
+        else:
+            return jsonify({'success': 'Product quantity increased in cart'}), 200
 
     except Exception as e:
         current_app.logger.error(f"Unexpected error in add_to_cart_route: {e}", exc_info=True)
@@ -84,13 +96,12 @@ def decrement_from_cart_route(product_id):
 def get_cart_route():
     """Получить содержимое корзины."""
     try:
-        cart_items = get_cart()
-        total = get_cart_total()
+        snapshot = get_cart_snapshot()
 
         return jsonify({
-            'cart': cart_items,
-            'total': total,
-            'count': len(cart_items)
+            'cart': snapshot['items'],
+            'total': snapshot['total'],
+            'count': snapshot['count']
         }), 200
 
     except Exception as e:
@@ -122,48 +133,19 @@ def toggle_addition_route(product_id):
         if not addition_name:
             return jsonify({'error': 'Addition name is required'}), 400
 
-        redis_conn = get_redis_connection()
-        cart_key = get_cart_key()
+        # Проверка и переключение дополнения - одна атомарная операция
+        new_state = toggle_cart_addition(product_id, addition_name)
 
-        # Получаем товар из корзины
-        existing_item_json = redis_conn.hget(cart_key, product_id)
-        if not existing_item_json:
+        if new_state == 'not_found':
             return jsonify({'error': 'Product not found in cart'}), 404
 
-        existing_item = json.loads(existing_item_json)
-        product_info = existing_item.get('product_info', {})
-
-        # Получаем текущие дополнения из продукта
-        additions = product_info.get('additions', {})
-
-        # Если additions это список - преобразуем в словарь
-        if isinstance(additions, list):
-            additions_dict = {addition: False for addition in additions}
-            product_info['additions'] = additions_dict
-            additions = additions_dict
-
-        # Проверяем, существует ли такое дополнение
-        if addition_name not in additions:
+        if new_state == 'not_available':
             return jsonify({'error': f'Addition "{addition_name}" not available for this product'}), 400
 
-        # Переключаем состояние дополнения
-        current_state = additions.get(addition_name, False)
-        additions[addition_name] = not current_state
-
-        # Обновляем информацию о продукте в корзине
-        product_info['additions'] = additions
-        existing_item['product_info'] = product_info
-
-        # Сохраняем обратно в Redis
-        redis_conn.hset(cart_key, product_id, json.dumps(existing_item))
-
-        # Обновляем TTL
-        update_cart_ttl(cart_key)
-
         return jsonify({
             'success': f'Addition "{addition_name}" toggled',
             'addition_name': addition_name,
-            'new_state': not current_state,
+            'new_state': new_state,
             'product_id': product_id
         }), 200
 
@@ -176,15 +158,16 @@ def toggle_addition_route(product_id):
 def make_order():
     """Создание нового заказа на основе корзины пользователя."""
     try:
-        # Получаем корзину из сессии
-        cart_items = get_cart()
+        # Получаем корзину и ее сумму одним чтением
+        snapshot = get_cart_snapshot()
+        cart_items = snapshot['items']
 
         # Проверяем, что корзина не пуста
         if not cart_items:
             return jsonify({'error': 'Cart is empty'}), 400
 
-        # Получаем общую сумму корзины
-        total = Decimal(str(get_cart_total()))
+        # Общая сумма корзины
+        total = Decimal(str(snapshot['total']))
 
         # Получаем данные адреса из JSON
         data = request.get_json() or {}
@@ -236,32 +219,13 @@ def make_order():
             paid=True
         )
 
-        db.session.add(order)
-
         try:
-            db.session.commit()
-            
-            # Отправляем заказ на эндпоинт /make_recent
-            try:
-                recent_response = requests.post(
-                    f"{current_app.config.get('MAIN_SERVICE_URI')}/make_recent",
-                    json={
-                        'order_id': order.id,
-                        'products': cart_items  # Отправляем все поля продуктов из корзины
-                    },
-                    timeout=5  # 5 секунд таймаут
-                )
-                
-                if recent_response.status_code != 200:
-                    current_app.logger.warning(
-                        f"Failed to send order to recent endpoint: {recent_response.status_code}"
-                    )
-                else:
-                    current_app.logger.info("Order successfully sent to recent endpoint")
-                    
-            except requests.exceptions.RequestException as e:
-                current_app.logger.error(f"Error sending order to recent endpoint: {e}")
-            
+            # Заказ и его событие пишутся одной транзакцией (отдельной или в составе пачки)
+            save_order(order, cart_items)
+
+            # Событие доставит фоновый поток, ответ main не ждем
+            outbox_wakeup.set()
+
             # Очищаем корзину после успешного создания заказа
             clear_cart()
         except Exception as e:
@@ -289,6 +253,162 @@ def make_order():
         return jsonify({'error': 'Internal server error'}), 500
 
 
+def _parse_order_cursor(cursor):
+    """Курсор страницы "<order_time ISO>,<id>" -> (datetime, id)."""
+    order_time, _, order_id = cursor.rpartition(',')
+    return datetime.fromisoformat(order_time), int(order_id)
+
+
+def _order_filters():
+    """Условия выборки заказов из from/to/currency/product_id запроса."""
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+    return order_conditions(
+        datetime.fromisoformat(date_from) if date_from else None,
+        datetime.fromisoformat(date_to) if date_to else None,
+        request.args.get('currency'),
+        request.args.get('product_id', type=int)
+    )
+
+
+@bp.route('/orders', methods=['GET'])
+def get_orders():
+    """
+    История заказов, новые первыми.
+
+    Keyset-пагинация по (order_time, id): ?after=<next_after предыдущей страницы>&limit=.
+    Фильтры: from/to (ISO-время, to не включается), currency, product_id.
+    """
+    try:
+        limit = request.args.get('limit', current_app.config['ORDERS_PAGE_LIMIT'], type=int)
+
+        if limit < 1 or limit > current_app.config['ORDERS_MAX_LIMIT']:
+            return jsonify({'error': 'Invalid limit'}), 400
+
+        try:
+            after = request.args.get('after')
+            after = _parse_order_cursor(after) if after else None
+            conditions = _order_filters()
+        except ValueError:
+            return jsonify({'error': 'Invalid after, from or to'}), 400
+
+        query = UserOrders.query.filter(*conditions)
+        if after:
+            query = query.filter(tuple_(UserOrders.order_time, UserOrders.id) < tuple_(*after))
+
+        orders = (
+            query
+            .order_by(UserOrders.order_time.desc(), UserOrders.id.desc())
+            .limit(limit + 1)
+            .all()
+        )
+
+        page = orders[:limit]
+        next_after = None
+        if len(orders) > limit:
+            next_after = f"{page[-1].order_time.isoformat()},{page[-1].id}"
+
+        return jsonify({
+            'orders': [order.to_dict() for order in page],
+            'count': len(page),
+            'next_after': next_after
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error in get_orders: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@bp.route('/orders/export', methods=['GET'])
+def export_orders_route():
+    """
+    Потоковая выгрузка заказов (?format=ndjson|csv, фильтры как у /orders).
+
+    Ответ идет кусками без Content-Length; при Accept-Encoding: gzip сжимается на лету.
+    """
+    try:
+        export_format = request.args.get('format', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unknown format "{export_format}"'}), 400
+
+        try:
+            conditions = _order_filters()
+        except ValueError:
+            return jsonify({'error': 'Invalid from or to'}), 400
+
+        compress = 'gzip' in request.accept_encodings
+        mimetype, _ = EXPORT_FORMATS[export_format]
+        response = Response(
+            stream_with_context(export_orders(conditions, export_format, compress)),
+            mimetype=mimetype
+        )
+        response.headers['Content-Disposition'] = f'attachment; filename=orders.{export_format}'
+        # nginx не должен копить выгрузку во временном файле
+        response.headers['X-Accel-Buffering'] = 'no'
+        if compress:
+            response.headers['Content-Encoding'] = 'gzip'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error in export_orders_route: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@bp.route('/sales', methods=['GET'])
+def get_sales():
+    """
+    Продажи по продуктам и валютам из почасовых итогов.
+
+    ?from=&to= (ISO-время, по умолчанию последние 24 часа), group=hour|day|total,
+    product_id, currency.
+    """
+    try:
+        group = request.args.get('group', 'hour')
+        if group not in REPORT_GROUPS:
+            return jsonify({'error': f'Unknown group "{group}"'}), 400
+
+        try:
+            date_to = request.args.get('to')
+            date_to = datetime.fromisoformat(date_to) if date_to else datetime.now()
+            date_from = request.args.get('from')
+            date_from = datetime.fromisoformat(date_from) if date_from else date_to - timedelta(hours=24)
+        except ValueError:
+            return jsonify({'error': 'Invalid from or to'}), 400
+
+        sales = get_sales_report(
+            date_from,
+            date_to,
+            group=group,
+            product_id=request.args.get('product_id', type=int),
+            currency=request.args.get('currency')
+        )
+
+        return jsonify({
+            'sales': sales,
+            'count': len(sales),
+            'from': date_from.isoformat(),
+            'to': date_to.isoformat(),
+            'group': group
+        }), 200
+
+    except Exception as e:
+        current_app.logger.error(f"Unexpected error in get_sales: {e}", exc_info=True)
+        return jsonify({'error': 'Internal server error'}), 500
+
+
+@bp.route('/redis_pool', methods=['GET'])
+def redis_pool_stats():
+    """Статистика пула соединений Redis текущего воркера."""
+    return jsonify(get_pool_stats()), 200
+
+
+@bp.route('/main_client', methods=['GET'])
+def main_client_stats():
+    """Состояние клиента main текущего воркера: circuit breaker и задержки."""
+    return jsonify(get_main_client_stats()), 200
+
+
 @bp.route('/health')
 def health_check():
     """Health check с минимальной задержкой."""
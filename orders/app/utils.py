@@ -1,144 +1,305 @@
 """
 Утилиты для работы с корзиной.
+
+Корзина - хеш Redis, в котором у каждого товара несколько полей:
+    <product_id>:qty            - количество (HINCRBY)
+    <product_id>:price          - цена за единицу в миллионных долях
+    <product_id>:info           - JSON с информацией о продукте
+    <product_id>:add:<название> - состояние дополнения, "1" или "0"
+и поддерживаемые при каждом изменении итоги:
+    meta:total                  - сумма корзины в миллионных долях
+    meta:items                  - число позиций
+
+Все изменения корзины выполняются Lua-скриптами: одна атомарная операция
+вместе с обновлением TTL, без чтения-изменения-записи JSON в Python.
+
+У каждого покупателя своя корзина cart:{<cart_id>}. ID берется из заголовка
+или cookie; скрипты работают с одним ключом, поэтому в Redis Cluster
+корзины распределяются по слотам, а хеш-тег держит в одном слоте будущие
+ключи той же корзины.
 """
 
 import json
-import redis
+import re
+import uuid
 from decimal import Decimal
-from flask import current_app
+from flask import current_app, g, request
+from .redis_pool import get_redis_client
+
+MICROS = Decimal('0.000001')
+
+# Допустимый ID корзины; остальные значения заменяются новым ID
+CART_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+# Удаление всех полей товара и пустой корзины, общее для скриптов ниже
+REMOVE_ITEM_LUA = """
+local function remove_item(cart_key, product_id)
+    local prefix = product_id .. ':'
+    for _, field in ipairs(redis.call('HKEYS', cart_key)) do
+        if string.sub(field, 1, #prefix) == prefix then
+            redis.call('HDEL', cart_key, field)
+        end
+    end
+    if redis.call('HINCRBY', cart_key, 'meta:items', -1) <= 0 then
+        redis.call('DEL', cart_key)
+    end
+end
+"""
 
+# Добавить товар или увеличить количество на 1.
+# ARGV: product_id, ttl, цена в миллионных долях, info, названия дополнений...
+ADD_TO_CART_SCRIPT = """
+local quantity = redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':qty', 1)
+if quantity == 1 then
+    redis.call('HSET', KEYS[1], ARGV[1] .. ':price', ARGV[3], ARGV[1] .. ':info', ARGV[4])
+    for i = 5, #ARGV do
+        redis.call('HSET', KEYS[1], ARGV[1] .. ':add:' .. ARGV[i], '0')
+    end
+    redis.call('HINCRBY', KEYS[1], 'meta:items', 1)
+end
+local price = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':price')) or 0
+redis.call('HINCRBY', KEYS[1], 'meta:total', price)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return quantity
+"""
 
-def get_redis_connection():
-    """Соединение с Redis."""
-    return redis.from_url(current_app.config['REDIS_URL'], decode_responses=True)
+# Удалить товар целиком. ARGV: product_id, ttl
+REMOVE_FROM_CART_SCRIPT = REMOVE_ITEM_LUA + """
+local quantity = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':qty'))
+if not quantity then
+    return 0
+end
+local price = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':price')) or 0
+redis.call('HINCRBY', KEYS[1], 'meta:total', -price * quantity)
+remove_item(KEYS[1], ARGV[1])
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 1
+"""
 
+# Уменьшить количество на 1 или удалить товар. ARGV: product_id, ttl
+# Возвращает новое количество, 0 - товар удален, -1 - товара нет.
+DECREMENT_FROM_CART_SCRIPT = REMOVE_ITEM_LUA + """
+local quantity = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':qty'))
+if not quantity then
+    return -1
+end
+local price = tonumber(redis.call('HGET', KEYS[1], ARGV[1] .. ':price')) or 0
+redis.call('HINCRBY', KEYS[1], 'meta:total', -price)
+if quantity > 1 then
+    quantity = redis.call('HINCRBY', KEYS[1], ARGV[1] .. ':qty', -1)
+else
+    quantity = 0
+    remove_item(KEYS[1], ARGV[1])
+end
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return quantity
+"""
 
-def get_cart_key():
-    """Получить ключ корзины."""
-    return "cart:default_user"
+# Переключить дополнение. ARGV: product_id, ttl, название дополнения
+# Возвращает новое состояние (1/0), -1 - товара нет, -2 - дополнение недоступно.
+TOGGLE_ADDITION_SCRIPT = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1] .. ':qty') == 0 then
+    return -1
+end
+local field = ARGV[1] .. ':add:' .. ARGV[3]
+local state = redis.call('HGET', KEYS[1], field)
+if not state then
+    return -2
+end
+local new_state = state == '1' and '0' or '1'
+redis.call('HSET', KEYS[1], field, new_state)
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return tonumber(new_state)
+"""
 
 
-def update_cart_ttl(cart_key):
-    """Обновить TTL корзины."""
+def get_redis_connection():
+    """Соединение с Redis из общего пула процесса."""
+    return get_redis_client()
+
+
+def get_cart_id():
+    """
+    ID корзины текущего запроса.
+
+    Берется из заголовка CART_ID_HEADER, затем из cookie CART_COOKIE_NAME.
+    Если его нет или он некорректен, создается новый и отдается клиенту
+    в after_request (см. remember_cart_id).
+    """
+    if 'cart_id' not in g:
+        cart_id = (
+            request.headers.get(current_app.config['CART_ID_HEADER'])
+            or request.cookies.get(current_app.config['CART_COOKIE_NAME'])
+        )
+        if not cart_id or not CART_ID_PATTERN.match(cart_id):
+            cart_id = uuid.uuid4().hex
+            g.new_cart_id = True
+        g.cart_id = cart_id
+    return g.cart_id
+
+
+def get_cart_key(cart_id=None):
+    """Получить ключ корзины (по умолчанию - корзины текущего запроса)."""
+    return f"cart:{{{cart_id or get_cart_id()}}}"
+
+
+def remember_cart_id(response):
+    """
+    Отдать клиенту ID корзины в cookie и заголовке.
+
+    Cookie выдается для новой корзины и продлевается при каждом изменении
+    корзины: TTL в Redis скользящий, и cookie не должна истечь раньше него.
+    """
+    if g.get('new_cart_id') or g.get('cart_changed'):
+        response.set_cookie(
+            current_app.config['CART_COOKIE_NAME'],
+            g.cart_id,
+            max_age=get_cart_ttl(),
+            httponly=True,
+            samesite='Lax'
+        )
+        response.headers[current_app.config['CART_ID_HEADER']] = g.cart_id
+    return response
+
+
+def get_cart_ttl():
+    """TTL корзины в секундах."""
+    return current_app.config.get('CART_TTL_SECONDS', 172800)  # 48 часов по умолчанию
+
+
+def _run_cart_script(script, *args):
+    """Выполнить скрипт над корзиной текущего пользователя."""
+    g.cart_changed = True
     redis_conn = get_redis_connection()
-    ttl_seconds = current_app.config.get('CART_TTL_SECONDS', 172800)  # 48 часов по умолчанию
-    redis_conn.expire(cart_key, ttl_seconds)
+    return redis_conn.register_script(script)(keys=[get_cart_key()], args=args)
+
+
+def _addition_names(additions):
+    """Названия дополнений продукта в исходном порядке."""
+    if isinstance(additions, dict):
+        return list(additions)
+    if isinstance(additions, list):
+        return additions
+    return []
+
+
+def _to_micros(amount):
+    """Сумма в миллионных долях (целое число для HINCRBY)."""
+    return int(Decimal(str(amount)).quantize(MICROS) * 1000000)
+
+
+def _from_micros(micros):
+    """Сумма из миллионных долей, округленная до 6 знаков."""
+    return float((Decimal(int(micros or 0)) / 1000000).quantize(MICROS))
 
 
 def add_to_cart(product_id, product_info):
     """Добавить товар в корзину или увеличить количество на 1 если уже есть."""
-    redis_conn = get_redis_connection()
-    cart_key = get_cart_key()
-
     # Преобразуем cost в Decimal если он пришел как float
     if 'cost' in product_info and isinstance(product_info['cost'], float):
         product_info['cost'] = float(Decimal(str(product_info['cost'])).quantize(Decimal('0.000001')))
 
-    # Преобразуем additions из списка в словарь если нужно
-    if 'additions' in product_info and isinstance(product_info['additions'], list):
-        product_info['additions'] = {addition: False for addition in product_info['additions']}
-
-    # Проверяем, есть ли уже товар в корзине
-    existing_item_json = redis_conn.hget(cart_key, product_id)
-
-    if existing_item_json:
-        # Товар уже есть - увеличиваем количество на 1
-        existing_item = json.loads(existing_item_json)
-        existing_item['quantity'] += 1
-        redis_conn.hset(cart_key, product_id, json.dumps(existing_item))
-        result = 'incremented'
-    else:
-        # Товара нет - добавляем новый с количеством 1
-        cart_item = {
-            'product_id': product_id,
-            'quantity': 1,
-            'product_info': product_info
-        }
-        redis_conn.hset(cart_key, product_id, json.dumps(cart_item))
-        result = 'added'
+    # Дополнения хранятся списком названий, их состояние - в отдельных полях
+    additions = _addition_names(product_info.get('additions'))
+    product_info['additions'] = additions
 
-    # Обновляем TTL при любом изменении корзины
-    update_cart_ttl(cart_key)
-    return result
+    quantity = _run_cart_script(
+        ADD_TO_CART_SCRIPT, product_id, get_cart_ttl(), _to_micros(product_info.get('cost', 0)),
+        json.dumps(product_info), *additions
+    )
+    return 'added' if quantity == 1 else 'incremented'
 
 
 def remove_from_cart(product_id):
     """Удалить товар из корзины (полностью)."""
-    redis_conn = get_redis_connection()
-    cart_key = get_cart_key()
-
-    result = redis_conn.hdel(cart_key, product_id)
-
-    # Если в корзине еще остались товары, обновляем TTL
-    if redis_conn.hlen(cart_key) > 0:
-        update_cart_ttl(cart_key)
-
-    return result > 0
+    return _run_cart_script(REMOVE_FROM_CART_SCRIPT, product_id, get_cart_ttl()) == 1
 
 
 def decrement_from_cart(product_id):
     """Уменьшить количество товара в корзине на 1 или удалить если количество станет 0."""
-    redis_conn = get_redis_connection()
-    cart_key = get_cart_key()
-
-    # Проверяем, есть ли товар в корзине
-    existing_item_json = redis_conn.hget(cart_key, product_id)
+    quantity = _run_cart_script(DECREMENT_FROM_CART_SCRIPT, product_id, get_cart_ttl())
 
-    if not existing_item_json:
+    if quantity < 0:
         return 'not_found'
+    if quantity == 0:
+        return 'removed'
+    return 'decremented'
 
-    existing_item = json.loads(existing_item_json)
 
-    if existing_item['quantity'] > 1:
-        # Уменьшаем количество на 1
-        existing_item['quantity'] -= 1
-        redis_conn.hset(cart_key, product_id, json.dumps(existing_item))
-        result = 'decremented'
-    else:
-        # Если количество было 1 - удаляем товар из корзины
-        redis_conn.hdel(cart_key, product_id)
-        result = 'removed'
+def toggle_cart_addition(product_id, addition_name):
+    """
+    Переключить дополнение товара в корзине.
 
-    # Обновляем TTL при любом изменении корзины
-    if redis_conn.hlen(cart_key) > 0:
-        update_cart_ttl(cart_key)
+    Возвращает новое состояние (True/False), 'not_found' если товара нет
+    в корзине или 'not_available' если у товара нет такого дополнения.
+    """
+    state = _run_cart_script(TOGGLE_ADDITION_SCRIPT, product_id, get_cart_ttl(), addition_name)
+
+    if state == -1:
+        return 'not_found'
+    if state == -2:
+        return 'not_available'
+    return state == 1
 
-    return result
 
+def get_cart_snapshot():
+    """
+    Корзина за одно чтение: позиции, сумма и число позиций.
 
-def get_cart():
-    """Получить всю корзину."""
+    Сумма и количество берутся из поддерживаемых итогов, а не пересчитываются.
+    """
     redis_conn = get_redis_connection()
     cart_key = get_cart_key()
-    
+
     cart_data = redis_conn.hgetall(cart_key)
+    items = {}
+
+    for field, value in cart_data.items():
+        product_id, _, attribute = field.partition(':')
+        # Поля без атрибута - корзины в старом формате (один JSON на товар)
+        if not attribute or product_id == 'meta':
+            continue
+        items.setdefault(product_id, {})[attribute] = value
+
     cart_items = []
-    
-    for product_id, item_json in cart_data.items():
-        item = json.loads(item_json)
-        cart_items.append(item)
-    
-    return cart_items
+    for product_id, fields in items.items():
+        if 'qty' not in fields or 'info' not in fields:
+            continue
+        # Поля с некорректным ID (записанные до проверки в add_to_cart_route) пропускаются;
+        # "01" тоже: такую позицию не удалить через /cart/1
+        try:
+            quantity = int(fields['qty'])
+            if str(int(product_id)) != product_id:
+                continue
+            product_id = int(product_id)
+        except ValueError:
+            continue
+
+        product_info = json.loads(fields['info'])
+        product_info['additions'] = {
+            name: fields.get(f'add:{name}') == '1'
+            for name in _addition_names(product_info.get('additions'))
+        }
+        cart_items.append({
+            'product_id': product_id,
+            'quantity': quantity,
+            'product_info': product_info
+        })
+
+    return {
+        'items': cart_items,
+        'total': _from_micros(cart_data.get('meta:total')),
+        'count': len(cart_items)
+    }
 
 
 def clear_cart():
     """Очистить корзину."""
     redis_conn = get_redis_connection()
     cart_key = get_cart_key()
-    
-    redis_conn.delete(cart_key)
 
-
-def get_cart_total():
-    """Получить общую сумму корзины."""
-    cart_items = get_cart()
-    total = Decimal('0')
-    
-    for item in cart_items:
-        product_info = item['product_info']
-        quantity = item['quantity']
-        cost = Decimal(str(product_info.get('cost', 0)))
-        total += cost * quantity
-    
-    # Округляем до 6 знаков после запятой
-    return float(total.quantize(Decimal('0.000001')))
\ No newline at end of file
+    redis_conn.delete(cart_key)
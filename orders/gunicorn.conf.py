@@ -0,0 +1,44 @@
+"""
+Настройки gunicorn сервиса заказов.
+
+GUNICORN_WORKER_CLASS=sync   - потоки: воркеры x потоки одновременных запросов.
+GUNICORN_WORKER_CLASS=gevent - кооперативный режим: ожидание Redis, main
+и Postgres не занимает поток, воркер держит до GUNICORN_WORKER_CONNECTIONS
+одновременных запросов с теми же URL и ответами.
+
+Метрики Prometheus воркеров собираются в общем каталоге
+PROMETHEUS_MULTIPROC_DIR, который очищается при старте мастера.
+"""
+
+import os
+import shutil
+
+bind = "0.0.0.0:5001"
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'sync')
+workers = int(os.environ.get('GUNICORN_WORKERS', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 2))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000))
+
+# Логи в stdout/stderr для JSON-логирования контейнера
+accesslog = "-"
+errorlog = "-"
+capture_output = True
+enable_stdio_inheritance = True
+loglevel = "info"
+
+# Задается до загрузки приложения в воркерах: prometheus_client читает его при импорте
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus_multiproc')
+
+
+def on_starting(server):
+    """Удалить метрики прошлого запуска."""
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory, exist_ok=True)
+
+
+def post_fork(server, worker):
+    """В режиме gevent драйвер Postgres тоже должен уступать управление при ожидании."""
+    if worker_class == 'gevent':
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()